@@ -0,0 +1,147 @@
+import asyncio
+import csv
+import gzip
+import io
+import logging
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from aiogram import Bot
+from aiogram.types import FSInputFile
+
+from database.users import iter_users
+from database.bot_users import iter_non_subscribed_bot_users
+
+logger = logging.getLogger(__name__)
+
+# Telegram Bot API accepts documents up to 50 MB; keep a margin for gzip buffering
+PART_SIZE_LIMIT = 49 * 1024 * 1024
+_CHUNK_ROWS = 5000
+
+
+@dataclass
+class ExportPart:
+    """One gzip file of an export."""
+
+    path: str
+    filename: str
+    rows: int
+
+
+class _GzipPartWriter:
+    """Writes rows into gzip temp files, starting a new file when the size limit is reached."""
+
+    def __init__(self, name: str, header: Optional[list[str]], part_size_limit: int):
+        self.name = name
+        self.header = header
+        self.part_size_limit = part_size_limit
+        self.extension = "csv.gz" if header else "txt.gz"
+        self.parts: list[ExportPart] = []
+        self._raw = None
+        self._gzip = None
+
+    def _open_part(self):
+        fd, path = tempfile.mkstemp(prefix=f"{self.name}_", suffix=f".{self.extension}")
+        self._raw = os.fdopen(fd, "wb")
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        self.parts.append(ExportPart(path=path, filename="", rows=0))
+        if self.header:
+            self._gzip.write(self._format([self.header]))
+
+    def _close_part(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+            self._gzip = self._raw = None
+
+    def _format(self, rows: list) -> bytes:
+        if self.header:
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerows(rows)
+            return buffer.getvalue().encode("utf-8")
+        return "".join(f"{row[0]}\n" for row in rows).encode("utf-8")
+
+    def write_chunk(self, rows: list):
+        """Blocking: compresses a chunk of rows into the current part."""
+        if self._gzip is None or self._raw.tell() >= self.part_size_limit:
+            self._close_part()
+            self._open_part()
+        self._gzip.write(self._format(rows))
+        self.parts[-1].rows += len(rows)
+
+    def finish(self) -> list[ExportPart]:
+        self._close_part()
+        total = len(self.parts)
+        for number, part in enumerate(self.parts, 1):
+            suffix = f"_part{number}" if total > 1 else ""
+            part.filename = f"{self.name}{suffix}.{self.extension}"
+        return self.parts
+
+
+async def export_rows(
+    rows: AsyncIterator[tuple],
+    name: str,
+    header: Optional[list[str]] = None,
+    part_size_limit: int = PART_SIZE_LIMIT,
+) -> list[ExportPart]:
+    """Потоково выгружает строки в сжатые временные файлы (CSV, если задан заголовок)."""
+    writer = _GzipPartWriter(name, header, part_size_limit)
+    try:
+        chunk = []
+        async for row in rows:
+            chunk.append(row)
+            if len(chunk) >= _CHUNK_ROWS:
+                await asyncio.to_thread(writer.write_chunk, chunk)
+                chunk = []
+        if chunk:
+            await asyncio.to_thread(writer.write_chunk, chunk)
+        return writer.finish()
+    except BaseException:
+        remove_parts(writer.finish())
+        raise
+
+
+def remove_parts(parts: list[ExportPart]):
+    for part in parts:
+        try:
+            os.remove(part.path)
+        except OSError as e:
+            logger.warning(f"Не удалось удалить временный файл выгрузки {part.path}: {e}")
+
+
+async def send_export(bot: Bot, chat_id: int, with_details: bool = False):
+    """Выгружает подписчиков и неподписанных пользователей и отправляет файлы администратору."""
+    exports = (
+        (
+            iter_users(with_details),
+            "subscribed_users",
+            ["user_id", "subscribed_at", "daily_cat_time", "daily_cat_minute", "timezone"],
+            "подписчиков",
+            "Нет подписанных пользователей для выгрузки.",
+        ),
+        (
+            iter_non_subscribed_bot_users(with_details),
+            "non_subscribed_users",
+            ["user_id", "first_used_at"],
+            "не подписанных пользователей",
+            "Нет неподписанных пользователей для выгрузки.",
+        ),
+    )
+    for rows, name, header, title, empty_text in exports:
+        parts = await export_rows(rows, name, header if with_details else None)
+        try:
+            total = sum(part.rows for part in parts)
+            if not total:
+                await bot.send_message(chat_id, empty_text)
+                continue
+            for number, part in enumerate(parts, 1):
+                caption = f"📄 Список ID {total} {title}."
+                if len(parts) > 1:
+                    caption += f" Часть {number} из {len(parts)}."
+                await bot.send_document(
+                    chat_id, FSInputFile(part.path, filename=part.filename), caption=caption
+                )
+        finally:
+            remove_parts(parts)
@@ -1,24 +1,37 @@
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
 from aiogram.filters import Command
-
-from database.users import get_all_users
-from database.bot_users import get_all_bot_users, get_non_subscribed_bot_users
-from admin.keyboards import get_admin_keyboard, get_admin_reply_keyboard
+from aiogram.exceptions import TelegramBadRequest
+
+from database.users import get_users_page
+from database.bot_users import get_bot_users_page
+from database.stats import get_subscriber_count, get_bot_user_count
+from admin.keyboards import (
+    get_admin_keyboard,
+    get_admin_reply_keyboard,
+    get_user_list_page_keyboard,
+)
+from admin.export import send_export
+from services.scheduler import get_broadcast_progress
 
 admin_router = Router()
 
 
 @admin_router.message(Command("admin"))
 async def admin_panel(message: Message, db_path: str):
-    user_count = len(await get_all_users())
-    bot_user_count = len(await get_all_bot_users())
+    user_count = await get_subscriber_count()
+    bot_user_count = await get_bot_user_count()
 
     text = (
         f"<b>👑 Админ-панель</b>\n\n"
         f"👥 Подписанных пользователей: <b>{user_count}</b>\n"
         f"😺 Всего пользователей бота: <b>{bot_user_count}</b>"
     )
+    for name, stats in get_broadcast_progress():
+        text += (
+            f"\n📤 Идет рассылка {name}: отправлено <b>{stats.processed}</b> "
+            f"из {stats.total}, осталось {stats.backlog}, ~{stats.eta:.0f} с"
+        )
 
     # Use the admin inline keyboard
     keyboard = get_admin_keyboard(user_count, bot_user_count)
@@ -34,132 +47,110 @@ async def admin_panel(message: Message, db_path: str):
 
 
 # New handlers for the updated admin panel functionality
-@admin_router.callback_query(F.data == "admin_show_subscribers")
-async def show_subscribers_callback(callback: CallbackQuery, db_path: str, bot: Bot):
-    await callback.answer()
-    users = await get_all_users()
 
-    if not users:
-        await bot.send_message(callback.from_user.id, "База подписчиков пуста.")
-        return
+# Список ID показывается постранично (keyset-пагинация по user_id)
+PAGE_SIZE = 50
+
+_USER_LISTS = {
+    "subs": (
+        get_users_page,
+        get_subscriber_count,
+        "Список ID подписчиков",
+        "База подписчиков пуста.",
+    ),
+    "all": (
+        get_bot_users_page,
+        get_bot_user_count,
+        "Список ID всех пользователей бота",
+        "База пользователей бота пуста.",
+    ),
+}
+
+
+async def render_user_list_page(
+    kind: str, anchor: int | None = None, direction: str = "next"
+) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Готовит текст и клавиатуру для страницы списка пользователей."""
+    get_page, get_count, title, empty_text = _USER_LISTS[kind]
+    user_ids, has_more = await get_page(anchor, direction, PAGE_SIZE)
+    if not user_ids and anchor is not None:
+        # The page ran past the edge (e.g. users were removed): start from the beginning
+        anchor, direction = None, "next"
+        user_ids, has_more = await get_page(anchor, direction, PAGE_SIZE)
+    if not user_ids:
+        return empty_text, None
+
+    if direction == "prev":
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = anchor is not None, has_more
 
-    user_ids_str = "\n".join(map(str, users))
-    await bot.send_message(
-        callback.from_user.id, f"Список ID подписчиков:\n\n{user_ids_str}"
+    total = await get_count()
+    user_ids_str = "\n".join(map(str, user_ids))
+    text = f"{title} (всего {total}):\n\n{user_ids_str}"
+    keyboard = get_user_list_page_keyboard(
+        kind, user_ids[0], user_ids[-1], has_prev, has_next
     )
+    return text, keyboard
 
 
-@admin_router.message(F.text.contains("Количество подписчиков"))
-async def show_subscribers_message(message: Message, db_path: str):
-    users = await get_all_users()
+@admin_router.callback_query(F.data == "admin_show_subscribers")
+async def show_subscribers_callback(callback: CallbackQuery, db_path: str, bot: Bot):
+    await callback.answer()
+    text, keyboard = await render_user_list_page("subs")
+    await bot.send_message(callback.from_user.id, text, reply_markup=keyboard)
 
-    if not users:
-        await message.answer("База подписчиков пуста.")
-        return
 
-    user_ids_str = "\n".join(map(str, users))
-    await message.answer(f"Список ID подписчиков:\n\n{user_ids_str}")
+@admin_router.message(F.text.contains("Количество подписчиков"))
+async def show_subscribers_message(message: Message, db_path: str):
+    text, keyboard = await render_user_list_page("subs")
+    await message.answer(text, reply_markup=keyboard)
 
 
 @admin_router.callback_query(F.data == "admin_show_all_users")
 async def show_all_users_callback(callback: CallbackQuery, db_path: str, bot: Bot):
     await callback.answer()
-    bot_users = await get_all_bot_users()
-
-    if not bot_users:
-        await bot.send_message(callback.from_user.id, "База пользователей бота пуста.")
-        return
-
-    bot_user_ids_str = "\n".join(map(str, bot_users))
-    await bot.send_message(
-        callback.from_user.id,
-        f"Список ID всех пользователей бота:\n\n{bot_user_ids_str}",
-    )
+    text, keyboard = await render_user_list_page("all")
+    await bot.send_message(callback.from_user.id, text, reply_markup=keyboard)
 
 
 @admin_router.message(F.text.contains("Всего пользователей"))
 async def show_all_users_message(message: Message, db_path: str):
-    bot_users = await get_all_bot_users()
+    text, keyboard = await render_user_list_page("all")
+    await message.answer(text, reply_markup=keyboard)
+
 
-    if not bot_users:
-        await message.answer("База пользователей бота пуста.")
+@admin_router.callback_query(F.data.startswith("admin_page:"))
+async def user_list_page_callback(callback: CallbackQuery):
+    # Format: "admin_page:<kind>:<next|prev>:<anchor user_id>"
+    try:
+        _, kind, direction, anchor = callback.data.split(":")
+        text, keyboard = await render_user_list_page(kind, int(anchor), direction)
+    except (ValueError, KeyError):
+        await callback.answer("Ошибка: неверные данные страницы.", show_alert=True)
         return
 
-    bot_user_ids_str = "\n".join(map(str, bot_users))
-    await message.answer(f"Список ID всех пользователей бота:\n\n{bot_user_ids_str}")
+    await callback.answer()
+    if isinstance(callback.message, Message):
+        try:
+            await callback.message.edit_text(text, reply_markup=keyboard)
+        except TelegramBadRequest:
+            # Page content did not change
+            pass
 
 
 @admin_router.callback_query(F.data == "admin_export_data")
 async def export_data_callback(callback: CallbackQuery, db_path: str, bot: Bot):
     await callback.answer("Готовлю файлы...", show_alert=False)
+    await send_export(bot, callback.from_user.id)
 
-    # Get subscribed and non-subscribed users
-    subscribed_users = await get_all_users()
-    non_subscribed_users = await get_non_subscribed_bot_users()
 
-    # Send file with subscribed users
-    if subscribed_users:
-        subscribed_ids_str = "\n".join(map(str, subscribed_users))
-        subscribed_file = BufferedInputFile(
-            file=subscribed_ids_str.encode("utf-8"), filename="subscribed_users.txt"
-        )
-        await bot.send_document(
-            callback.from_user.id,
-            subscribed_file,
-            caption=f"📄 Список ID {len(subscribed_users)} подписчиков.",
-        )
-    else:
-        await bot.send_message(
-            callback.from_user.id, "Нет подписанных пользователей для выгрузки."
-        )
-
-    # Send file with non-subscribed users
-    if non_subscribed_users:
-        non_subscribed_ids_str = "\n".join(map(str, non_subscribed_users))
-        non_subscribed_file = BufferedInputFile(
-            file=non_subscribed_ids_str.encode("utf-8"),
-            filename="non_subscribed_users.txt",
-        )
-        await bot.send_document(
-            callback.from_user.id,
-            non_subscribed_file,
-            caption=f"📄 Список ID {len(non_subscribed_users)} не подписанных пользователей.",
-        )
-    else:
-        await bot.send_message(
-            callback.from_user.id, "Нет неподписанных пользователей для выгрузки."
-        )
+@admin_router.callback_query(F.data == "admin_export_csv")
+async def export_csv_callback(callback: CallbackQuery, db_path: str, bot: Bot):
+    await callback.answer("Готовлю CSV...", show_alert=False)
+    await send_export(bot, callback.from_user.id, with_details=True)
 
 
 @admin_router.message(F.text == "Выгрузить данные")
-async def export_data_message(message: Message, db_path: str):
-    # Get subscribed and non-subscribed users
-    subscribed_users = await get_all_users()
-    non_subscribed_users = await get_non_subscribed_bot_users()
-
-    # Send file with subscribed users
-    if subscribed_users:
-        subscribed_ids_str = "\n".join(map(str, subscribed_users))
-        subscribed_file = BufferedInputFile(
-            file=subscribed_ids_str.encode("utf-8"), filename="subscribed_users.txt"
-        )
-        await message.answer_document(
-            subscribed_file,
-            caption=f"📄 Список ID {len(subscribed_users)} подписчиков.",
-        )
-    else:
-        await message.answer("Нет подписанных пользователей для выгрузки.")
-
-    # Send file with non-subscribed users
-    if non_subscribed_users:
-        non_subscribed_ids_str = "\n".join(map(str, non_subscribed_users))
-        non_subscribed_file = BufferedInputFile(
-            file=non_subscribed_ids_str.encode("utf-8"),
-            filename="non_subscribed_users.txt",
-        )
-        await message.answer_document(
-            non_subscribed_file,
-            caption=f"📄 Список ID {len(non_subscribed_users)} не подписанных пользователей.",
-        )
-    else:
-        await message.answer("Нет неподписанных пользователей для выгрузки.")
+async def export_data_message(message: Message, db_path: str, bot: Bot):
+    await send_export(bot, message.chat.id)
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from aiogram.types import (
     InlineKeyboardButton,
     InlineKeyboardMarkup,
@@ -7,6 +9,8 @@ from aiogram.types import (
 from aiogram.utils.keyboard import InlineKeyboardBuilder, ReplyKeyboardBuilder
 
 
+# Клавиатуры зависят только от счетчиков, поэтому кэшируются по их значениям
+@lru_cache(maxsize=256)
 def get_admin_keyboard(user_count: int = 0, bot_user_count: int = 0) -> InlineKeyboardMarkup:
     """Генерирует клавиатуру для админ-панели."""
     builder = InlineKeyboardBuilder()
@@ -25,9 +29,15 @@ def get_admin_keyboard(user_count: int = 0, bot_user_count: int = 0) -> InlineKe
             text="Выгрузить данные", callback_data="admin_export_data"
         )
     )
+    builder.row(
+        InlineKeyboardButton(
+            text="Выгрузить CSV (время, таймзона)", callback_data="admin_export_csv"
+        )
+    )
     return builder.as_markup()
 
 
+@lru_cache(maxsize=256)
 def get_admin_reply_keyboard(
     user_count: int = 0, bot_user_count: int = 0
 ) -> ReplyKeyboardMarkup:
@@ -37,3 +47,21 @@ def get_admin_reply_keyboard(
     builder.row(KeyboardButton(text=f"Всего пользователей ({bot_user_count})"))
     builder.row(KeyboardButton(text="Выгрузить данные"))
     return builder.as_markup(resize_keyboard=True)
+
+
+def get_user_list_page_keyboard(
+    kind: str, first_id: int, last_id: int, has_prev: bool, has_next: bool
+) -> InlineKeyboardMarkup | None:
+    """Генерирует кнопки «назад/вперед» для постраничного списка пользователей."""
+    buttons = []
+    if has_prev:
+        buttons.append(
+            InlineKeyboardButton(text="◀️ Назад", callback_data=f"admin_page:{kind}:prev:{first_id}")
+        )
+    if has_next:
+        buttons.append(
+            InlineKeyboardButton(text="Вперед ▶️", callback_data=f"admin_page:{kind}:next:{last_id}")
+        )
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
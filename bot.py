@@ -1,14 +1,70 @@
 import asyncio
+from datetime import datetime, timezone
 from aiogram.types import BotCommand
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from config.settings import BOT_TOKEN, CAT_API_KEY, DATABASE_NAME, get_admin_ids, logger
+from config.settings import (
+    BOT_TOKEN,
+    CAT_API_KEY,
+    DATABASE_NAME,
+    DB_POOL_SIZE,
+    DB_HEALTH_CHECK_INTERVAL,
+    DB_WRITE_BATCH_SIZE,
+    DB_WRITE_BATCH_DELAY,
+    DB_JOURNAL_MODE,
+    DB_SYNCHRONOUS,
+    DB_MMAP_SIZE,
+    DB_CACHE_SIZE,
+    DB_BUSY_TIMEOUT,
+    DB_TEMP_STORE,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    IMAGE_HISTORY_SIZE,
+    IMAGE_HISTORY_CACHE_SIZE,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_MB,
+    IMAGE_CACHE_CONCURRENCY,
+    CAT_API_LIMIT_PER_HOST,
+    CAT_API_DNS_CACHE_TTL,
+    CAT_API_KEEPALIVE_TIMEOUT,
+    CAT_API_TIMEOUT,
+    CAT_API_CONNECT_TIMEOUT,
+    CAT_API_RETRIES,
+    CAT_API_RETRY_BASE_DELAY,
+    CAT_API_RETRY_MAX_DELAY,
+    CAT_API_BREAKER_THRESHOLD,
+    CAT_API_BREAKER_RESET_TIMEOUT,
+    CAT_FALLBACK_DIR,
+    CAT_FALLBACK_URLS,
+    CAT_RESERVOIR_SIZE,
+    CAT_RESERVOIR_LOW_WATER,
+    CAT_RESERVOIR_BATCH_SIZE,
+    CAT_RESERVOIR_RECYCLE_SIZE,
+    BOT_MODE,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_WORKERS,
+    WEBHOOK_DRAIN_TIMEOUT,
+    get_admin_ids,
+    logger,
+)
 from bot.core import create_bot, create_dispatcher
-from database.connection import init_db_connection
+from bot.webhook import is_valid_secret, run_webhook
+from database.connection import StorageProfile, init_db_connection
+from database.users import configure_user_cache, refresh_next_deliveries
+from database.image_history import configure_image_history
 from users.handlers import router as user_router
 from admin.handlers import admin_router
 from admin.filters import IsAdmin
-from services.scheduler import send_daily_cats
+from services.scheduler import deliver_due_cats, resume_broadcasts
+from services.cat_api import init_cat_api_client
+from services.cat_reservoir import init_cat_reservoir, load_fallback_images
+from services.image_cache import init_image_cache
+from services.timezone_resolver import get_timezone_resolver
 from admin.keyboards import get_admin_reply_keyboard
 
 
@@ -18,12 +74,71 @@ async def main():
             "Необходимые переменные окружения не установлены! (BOT_TOKEN, CAT_API_KEY, DATABASE_NAME)"
         )
         return
+    if BOT_MODE == "webhook" and not (WEBHOOK_URL and WEBHOOK_SECRET):
+        # Without the secret anyone could post forged updates (e.g. from an admin's id)
+        logger.critical("BOT_MODE=webhook требует переменные окружения WEBHOOK_URL и WEBHOOK_SECRET")
+        return
+    if BOT_MODE == "webhook" and not is_valid_secret(WEBHOOK_SECRET):
+        logger.critical("WEBHOOK_SECRET: 1-256 символов из A-Z, a-z, 0-9, _ и -")
+        return
 
     admin_ids = get_admin_ids()
 
     # Инициализация базы данных
-    db_connection = init_db_connection(DATABASE_NAME)
+    storage_profile = StorageProfile(
+        journal_mode=DB_JOURNAL_MODE,
+        synchronous=DB_SYNCHRONOUS,
+        mmap_size=DB_MMAP_SIZE,
+        cache_size=DB_CACHE_SIZE,
+        busy_timeout=DB_BUSY_TIMEOUT,
+        temp_store=DB_TEMP_STORE,
+    )
+    db_connection = init_db_connection(
+        DATABASE_NAME, DB_POOL_SIZE, DB_HEALTH_CHECK_INTERVAL, storage_profile
+    )
     await db_connection.init_db()
+    db_connection.start_write_queue(DB_WRITE_BATCH_SIZE, DB_WRITE_BATCH_DELAY)
+    configure_user_cache(USER_CACHE_SIZE, USER_CACHE_TTL)
+    configure_image_history(IMAGE_HISTORY_SIZE, IMAGE_HISTORY_CACHE_SIZE)
+    # Заполняем время следующей доставки для подписчиков, у которых его еще нет
+    await refresh_next_deliveries()
+
+    # Общий HTTP-клиент для TheCatAPI
+    cat_api_client = init_cat_api_client(
+        CAT_API_KEY,
+        limit_per_host=CAT_API_LIMIT_PER_HOST,
+        dns_cache_ttl=CAT_API_DNS_CACHE_TTL,
+        keepalive_timeout=CAT_API_KEEPALIVE_TIMEOUT,
+        total_timeout=CAT_API_TIMEOUT,
+        connect_timeout=CAT_API_CONNECT_TIMEOUT,
+        retries=CAT_API_RETRIES,
+        retry_base_delay=CAT_API_RETRY_BASE_DELAY,
+        retry_max_delay=CAT_API_RETRY_MAX_DELAY,
+        breaker_threshold=CAT_API_BREAKER_THRESHOLD,
+        breaker_reset_timeout=CAT_API_BREAKER_RESET_TIMEOUT,
+    )
+    # Границы часовых поясов загружаются заранее, чтобы не задерживать первую геолокацию
+    await asyncio.to_thread(get_timezone_resolver)
+    # Дисковый кэш картинок (необязательный), чтобы не зависеть от скорости CDN
+    image_cache = None
+    if IMAGE_CACHE_MAX_MB > 0:
+        image_cache = init_image_cache(
+            IMAGE_CACHE_DIR,
+            int(IMAGE_CACHE_MAX_MB * 2**20),
+            concurrency=IMAGE_CACHE_CONCURRENCY,
+            timeout=CAT_API_TIMEOUT,
+        )
+        await image_cache.start()
+    # Резерв готовых картинок, чтобы /cat не ждал ответа TheCatAPI
+    cat_reservoir = init_cat_reservoir(
+        cat_api_client,
+        capacity=CAT_RESERVOIR_SIZE,
+        low_water=CAT_RESERVOIR_LOW_WATER,
+        batch_size=CAT_RESERVOIR_BATCH_SIZE,
+        recycle_size=CAT_RESERVOIR_RECYCLE_SIZE,
+        fallback=load_fallback_images(CAT_FALLBACK_DIR, CAT_FALLBACK_URLS),
+    )
+    await cat_reservoir.start()
 
     bot = create_bot()
     dp = create_dispatcher()
@@ -43,12 +158,22 @@ async def main():
 
     # Настройка и запуск планировщика
     scheduler = AsyncIOScheduler(timezone="UTC")
-    # Run the scheduler every hour to check if any users should receive their daily cat
+    # Every minute: deliver cats to subscribers whose chosen time has come
     scheduler.add_job(
-        send_daily_cats,
+        deliver_due_cats,
         "cron",
-        minute=0,
-        args=(bot, DATABASE_NAME, CAT_API_KEY),
+        second=0,
+        args=(bot, CAT_API_KEY),
+    )
+    # Fill in delivery times that could not be computed earlier once an hour
+    scheduler.add_job(refresh_next_deliveries, "cron", minute=55)
+    # Continue broadcasts interrupted by a restart (right away and then every minute)
+    scheduler.add_job(
+        resume_broadcasts,
+        "interval",
+        minutes=1,
+        args=(bot,),
+        next_run_time=datetime.now(timezone.utc),
     )
     scheduler.start()
 
@@ -80,13 +205,10 @@ async def main():
     if admin_ids:
         try:
             # Get user count for admin keyboard
-            from database.users import get_all_users
-            from database.bot_users import get_all_bot_users
+            from database.stats import get_subscriber_count, get_bot_user_count
 
-            users = await get_all_users()
-            user_count = len(users)
-            bot_users = await get_all_bot_users()
-            bot_user_count = len(bot_users)
+            user_count = await get_subscriber_count()
+            bot_user_count = await get_bot_user_count()
 
             await bot.send_message(
                 admin_ids[0],
@@ -99,8 +221,30 @@ async def main():
             )
 
     # Запускаем бота
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(
+                dp,
+                bot,
+                WEBHOOK_URL,
+                WEBHOOK_HOST,
+                WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret=WEBHOOK_SECRET,
+                queue_size=WEBHOOK_QUEUE_SIZE,
+                workers=WEBHOOK_WORKERS,
+                drain_timeout=WEBHOOK_DRAIN_TIMEOUT,
+            )
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
+    finally:
+        scheduler.shutdown(wait=False)
+        await cat_reservoir.stop()
+        if image_cache is not None:
+            await image_cache.stop()
+        await cat_api_client.close()
+        await db_connection.close()
 
 
 if __name__ == "__main__":
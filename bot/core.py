@@ -2,8 +2,11 @@ from aiogram import Bot
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram import Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
-from config.settings import BOT_TOKEN, logger
+from config.settings import BOT_TOKEN, TELEGRAM_API_URL, logger
+from bot.middlewares import FirstSeenMiddleware
 
 
 def create_bot() -> Bot:
@@ -12,7 +15,16 @@ def create_bot() -> Bot:
         logger.critical("BOT_TOKEN is not set!")
         raise ValueError("BOT_TOKEN is required")
 
-    bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode="HTML"))
+    session = None
+    if TELEGRAM_API_URL:
+        # Self-hosted Bot API server or a local fake endpoint for testing
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+
+    bot = Bot(
+        token=BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode="HTML"),
+    )
     return bot
 
 
@@ -20,4 +32,6 @@ def create_dispatcher() -> Dispatcher:
     """Create and configure the dispatcher."""
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
+    # Runs after aiogram's UserContextMiddleware, so event_from_user is available
+    dp.update.outer_middleware(FirstSeenMiddleware())
     return dp
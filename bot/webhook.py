@@ -0,0 +1,156 @@
+import asyncio
+import hmac
+import logging
+import re
+import signal
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Characters and length Telegram accepts for secret_token
+_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def is_valid_secret(secret: Optional[str]) -> bool:
+    return bool(secret) and _SECRET_RE.fullmatch(secret) is not None
+
+
+class WebhookServer:
+    """Receives updates over HTTP and handles them with a pool of workers.
+
+    The request handler only checks the secret token (required: without it
+    anyone could post forged updates) and puts the update
+    into a bounded queue, so Telegram gets its 200 immediately. When the queue
+    is full the server answers 503 and Telegram redelivers the update later.
+    On shutdown the HTTP server stops accepting requests first, then the
+    queued updates are drained (up to ``drain_timeout``) before the workers stop.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = "/webhook",
+        secret: str = "",
+        queue_size: int = 1000,
+        workers: int = 16,
+        drain_timeout: float = 30.0,
+    ):
+        if not is_valid_secret(secret):
+            raise ValueError("webhook secret must be 1-256 characters of A-Z, a-z, 0-9, _ and -")
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.workers = max(1, workers)
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue[Update] = asyncio.Queue(maxsize=max(1, queue_size))
+        self._tasks: list[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            logger.warning(f"Webhook-запрос с неверным секретом от {request.remote}")
+            return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Не удалось разобрать update из webhook-запроса: {e}")
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning("Очередь webhook-обновлений переполнена, просим Telegram повторить")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def start(self, host: str, port: int):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook-сервер слушает {host}:{port}{self.path}")
+
+    async def stop(self):
+        """Stops accepting updates, drains the queue and stops the workers."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Не дождались обработки {self._queue.qsize()} webhook-обновлений при остановке"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    host: str,
+    port: int,
+    path: str = "/webhook",
+    secret: str = "",
+    queue_size: int = 1000,
+    workers: int = 16,
+    drain_timeout: float = 30.0,
+    drop_pending_updates: bool = False,
+):
+    """Registers the webhook with Telegram and serves updates until SIGINT/SIGTERM.
+
+    Pending updates are kept by default: with several replicas behind the
+    webhook, restarting one of them must not discard updates for the others.
+    """
+    server = WebhookServer(dp, bot, path, secret, queue_size, workers, drain_timeout)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: fall back to KeyboardInterrupt
+
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    workflow_data.pop("bot", None)
+    await dp.emit_startup(bot=bot, **workflow_data)
+    await server.start(host, port)
+    try:
+        await bot.set_webhook(
+            url.rstrip("/") + path,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=drop_pending_updates,
+        )
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
@@ -12,6 +12,90 @@ CAT_API_KEY = os.getenv("CAT_API_KEY")
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 ADMIN_ID = os.getenv("ADMIN_ID")
 
+# Database connection pool configuration
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "60"))
+
+# Write-behind batching: writes are grouped into one transaction
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "100"))
+DB_WRITE_BATCH_DELAY = float(os.getenv("DB_WRITE_BATCH_DELAY", "0.005"))  # seconds
+
+# SQLite storage profile (applied to every pooled connection)
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-16000"))
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))
+DB_TEMP_STORE = os.getenv("DB_TEMP_STORE", "MEMORY")
+
+# In-memory cache of subscriber state (subscribed, hour, timezone)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+# TheCatAPI HTTP client configuration
+CAT_API_LIMIT_PER_HOST = int(os.getenv("CAT_API_LIMIT_PER_HOST", "10"))
+CAT_API_DNS_CACHE_TTL = int(os.getenv("CAT_API_DNS_CACHE_TTL", "300"))
+CAT_API_KEEPALIVE_TIMEOUT = float(os.getenv("CAT_API_KEEPALIVE_TIMEOUT", "30"))
+CAT_API_TIMEOUT = float(os.getenv("CAT_API_TIMEOUT", "10"))
+CAT_API_CONNECT_TIMEOUT = float(os.getenv("CAT_API_CONNECT_TIMEOUT", "5"))
+CAT_API_RETRIES = int(os.getenv("CAT_API_RETRIES", "3"))
+CAT_API_RETRY_BASE_DELAY = float(os.getenv("CAT_API_RETRY_BASE_DELAY", "0.5"))
+CAT_API_RETRY_MAX_DELAY = float(os.getenv("CAT_API_RETRY_MAX_DELAY", "5"))
+CAT_API_BREAKER_THRESHOLD = int(os.getenv("CAT_API_BREAKER_THRESHOLD", "5"))
+CAT_API_BREAKER_RESET_TIMEOUT = float(os.getenv("CAT_API_BREAKER_RESET_TIMEOUT", "30"))
+
+# Local fallback images used when TheCatAPI is down
+CAT_FALLBACK_DIR = os.getenv("CAT_FALLBACK_DIR", "data/fallback_cats")
+CAT_FALLBACK_URLS = [
+    url.strip() for url in os.getenv("CAT_FALLBACK_URLS", "").split(",") if url.strip()
+]
+
+# Prefetched cat image reservoir
+CAT_RESERVOIR_SIZE = int(os.getenv("CAT_RESERVOIR_SIZE", "100"))
+CAT_RESERVOIR_LOW_WATER = int(os.getenv("CAT_RESERVOIR_LOW_WATER", "20"))
+CAT_RESERVOIR_BATCH_SIZE = int(os.getenv("CAT_RESERVOIR_BATCH_SIZE", "25"))
+CAT_RESERVOIR_RECYCLE_SIZE = int(os.getenv("CAT_RESERVOIR_RECYCLE_SIZE", "200"))
+
+# Per-user history of received images (a ring of hashed image ids)
+IMAGE_HISTORY_SIZE = int(os.getenv("IMAGE_HISTORY_SIZE", "32"))
+IMAGE_HISTORY_CACHE_SIZE = int(os.getenv("IMAGE_HISTORY_CACHE_SIZE", "10000"))
+
+# Optional on-disk image cache (0 MB = disabled): images are sent from local copies
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "data/image_cache")
+IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "0"))
+IMAGE_CACHE_CONCURRENCY = int(os.getenv("IMAGE_CACHE_CONCURRENCY", "4"))
+
+# Broadcast (daily cats) configuration
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "20"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # messages per second overall
+BROADCAST_PER_CHAT_RATE = float(os.getenv("BROADCAST_PER_CHAT_RATE", "1"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+# Spread each broadcast evenly over this many seconds (0 = send as fast as allowed)
+BROADCAST_PACING_WINDOW = float(os.getenv("BROADCAST_PACING_WINDOW", "45"))
+# Per-run pool of distinct images assigned to recipients round-robin
+BROADCAST_IMAGE_POOL_SIZE = int(os.getenv("BROADCAST_IMAGE_POOL_SIZE", "100"))
+BROADCAST_IMAGE_FETCH_CONCURRENCY = int(os.getenv("BROADCAST_IMAGE_FETCH_CONCURRENCY", "4"))
+# Persistent broadcast jobs: interrupted runs are resumed within this window
+BROADCAST_RESUME_WINDOW = float(os.getenv("BROADCAST_RESUME_WINDOW", "7200"))  # seconds
+BROADCAST_JOB_LEASE_TTL = float(os.getenv("BROADCAST_JOB_LEASE_TTL", "60"))
+BROADCAST_LOG_BATCH_SIZE = int(os.getenv("BROADCAST_LOG_BATCH_SIZE", "500"))
+BROADCAST_LOG_FLUSH_INTERVAL = float(os.getenv("BROADCAST_LOG_FLUSH_INTERVAL", "1"))
+# The replica holding this lease runs the per-minute delivery wheel
+DELIVERY_LEADER_TTL = float(os.getenv("DELIVERY_LEADER_TTL", "180"))
+
+# Update delivery: "polling" (getUpdates) or "webhook" (aiohttp server)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+# Custom Bot API server (self-hosted or a local fake for testing)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
 # Logging configuration
 log_formatter = logging.Formatter(
     "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
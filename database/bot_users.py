@@ -1,47 +1,36 @@
 import logging
-from typing import List
+from typing import AsyncIterator, List
 from database.connection import get_db_connection
 from database.models import BotUser
+from database.stats import BOT_USERS, adjust_count
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# Пользователи, которые уже точно есть в bot_users (не требуют обращения к БД)
+_seen_users = TTLCache(maxsize=100000, ttl=float("inf"))
 
-async def is_bot_user(user_id: int) -> bool:
-    """Проверяет, использовал ли пользователь бота ранее."""
-    db_conn = get_db_connection()
-    if not db_conn:
-        logger.error("Database connection not initialized")
-        return False
-        
-    try:
-        rows = await db_conn.execute_query(
-            "SELECT 1 FROM bot_users WHERE user_id = ?", (user_id,)
-        )
-        return len(rows) > 0
-    except Exception as e:
-        logger.error(f"Error checking if user is bot user: {e}")
-        return False
 
+async def register_bot_user(user_id: int):
+    """Записывает пользователя в bot_users при первом появлении (одним INSERT OR IGNORE)."""
+    if _seen_users.get(user_id):
+        return
 
-async def add_bot_user(user_id: int):
-    """Добавляет пользователя в таблицу bot_users при первом использовании."""
     db_conn = get_db_connection()
     if not db_conn:
         logger.error("Database connection not initialized")
         return
-        
+
     try:
-        await db_conn.execute_command(
-            "INSERT INTO bot_users (user_id) VALUES (?)", (user_id,)
+        inserted = await db_conn.execute_command(
+            "INSERT OR IGNORE INTO bot_users (user_id) VALUES (?)", (user_id,)
         )
-        logger.info(f"Пользователь {user_id} добавлен в таблицу bot_users.")
+        _seen_users.set(user_id, True)
+        if inserted:
+            adjust_count(BOT_USERS, inserted)
+            logger.info(f"Пользователь {user_id} добавлен в таблицу bot_users.")
     except Exception as e:
-        if "UNIQUE constraint failed" in str(e):
-            logger.warning(
-                f"Пользователь {user_id} уже существует в таблице bot_users."
-            )
-        else:
-            logger.error(f"Error adding bot user: {e}")
+        logger.error(f"Error registering bot user: {e}")
 
 
 async def get_all_bot_users() -> List[int]:
@@ -80,6 +69,52 @@ async def get_non_subscribed_bot_users() -> List[int]:
         return []
 
 
+async def get_bot_users_page(
+    anchor: int | None = None, direction: str = "next", limit: int = 50
+) -> tuple[List[int], bool]:
+    """Возвращает страницу ID пользователей бота после (next) или до (prev) anchor и признак, что дальше есть еще."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return [], False
+
+    try:
+        if direction == "prev":
+            rows = await db_conn.execute_query(
+                "SELECT user_id FROM bot_users WHERE user_id < ? ORDER BY user_id DESC LIMIT ?",
+                (anchor, limit + 1),
+            )
+            rows.reverse()
+            has_more = len(rows) > limit
+            return [row[0] for row in rows[-limit:]], has_more
+        rows = await db_conn.execute_query(
+            "SELECT user_id FROM bot_users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (anchor if anchor is not None else -1, limit + 1),
+        )
+        return [row[0] for row in rows[:limit]], len(rows) > limit
+    except Exception as e:
+        logger.error(f"Error getting bot users page: {e}")
+        return [], False
+
+
+async def iter_non_subscribed_bot_users(with_details: bool = False) -> AsyncIterator[tuple]:
+    """Построчно выдает неподписанных пользователей бота: (user_id,) или (user_id, first_used_at)."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return
+
+    columns = "bu.user_id, bu.first_used_at" if with_details else "bu.user_id"
+    async for row in db_conn.iterate_query(f"""
+        SELECT {columns}
+        FROM bot_users bu
+        LEFT JOIN users u ON bu.user_id = u.user_id
+        WHERE u.user_id IS NULL
+        ORDER BY bu.user_id
+    """):
+        yield row
+
+
 async def get_first_used_at(user_id: int) -> str | None:
     """Возвращает дату и время первого использования бота пользователем."""
     db_conn = get_db_connection()
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Iterable, List, Mapping, Optional, Sequence
+
+from database.connection import get_db_connection
+from database.models import BroadcastJob
+
+logger = logging.getLogger(__name__)
+
+# Журнал доставки завершенных рассылок хранится неделю
+_KEEP_FINISHED = 7 * 24 * 3600
+
+
+async def create_job(
+    name: str,
+    photo: str,
+    caption: Optional[str],
+    user_ids: Iterable[int],
+    reschedule: Sequence[tuple[Optional[int], int]] = (),
+    photos: Optional[Mapping[int, str]] = None,
+) -> Optional[int]:
+    """Сохраняет рассылку вместе со списком получателей одной транзакцией.
+
+    ``photos`` — своя картинка для отдельных получателей (остальным уходит ``photo``).
+    ``reschedule`` — пары (next_delivery_at, user_id): в той же транзакции получателям
+    назначается следующая доставка, так что одну и ту же доставку нельзя запланировать дважды.
+    Возвращает job_id или None, если рассылка с таким именем уже существует.
+    """
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return None
+
+    now = time.time()
+    async with db_conn.get_db() as db:
+        try:
+            cursor = await db.execute(
+                "INSERT OR IGNORE INTO broadcast_jobs (name, photo, caption, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (name, photo, caption, now),
+            )
+            if not cursor.rowcount:
+                await db.rollback()
+                return None
+            job_id = cursor.lastrowid
+            photos = photos or {}
+            await db.executemany(
+                "INSERT OR IGNORE INTO broadcast_deliveries (job_id, user_id, photo) "
+                "VALUES (?, ?, ?)",
+                ((job_id, user_id, photos.get(user_id)) for user_id in user_ids),
+            )
+            if reschedule:
+                await db.executemany(
+                    "UPDATE users SET next_delivery_at = ? WHERE user_id = ?", reschedule
+                )
+            # Заодно убираем старые завершенные рассылки
+            await db.execute(
+                "DELETE FROM broadcast_deliveries WHERE job_id IN ("
+                "SELECT job_id FROM broadcast_jobs WHERE status != 'running' AND created_at < ?)",
+                (now - _KEEP_FINISHED,),
+            )
+            await db.execute(
+                "DELETE FROM broadcast_jobs WHERE status != 'running' AND created_at < ?",
+                (now - _KEEP_FINISHED,),
+            )
+            await db.commit()
+            return job_id
+        except Exception:
+            await db.rollback()
+            raise
+
+
+async def get_unfinished_jobs(since: float) -> List[BroadcastJob]:
+    """Возвращает незавершенные рассылки, созданные не раньше ``since``."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return []
+
+    rows = await db_conn.execute_query(
+        "SELECT job_id, name, photo, caption, file_id, created_at FROM broadcast_jobs "
+        "WHERE status = 'running' AND created_at >= ? ORDER BY created_at",
+        (since,),
+    )
+    return [BroadcastJob.from_row(row) for row in rows]
+
+
+async def abandon_stale_jobs(before: float) -> int:
+    """Помечает брошенными незавершенные рассылки, которые продолжать уже поздно."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return 0
+
+    return await db_conn.execute_command(
+        "UPDATE broadcast_jobs SET status = 'abandoned', finished_at = ? "
+        "WHERE status = 'running' AND created_at < ?",
+        (time.time(), before),
+    )
+
+
+async def get_pending_deliveries(job_id: int) -> List[tuple[int, Optional[str]]]:
+    """Получатели, которым рассылка еще не доставлена и которые все еще подписаны.
+
+    Возвращает пары (user_id, photo); photo — личная картинка получателя или None.
+    """
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return []
+
+    rows = await db_conn.execute_query(
+        "SELECT d.user_id, d.photo FROM broadcast_deliveries AS d "
+        "JOIN users AS u ON u.user_id = d.user_id "
+        "WHERE d.job_id = ? AND d.status = 'pending'",
+        (job_id,),
+    )
+    return [(row[0], row[1]) for row in rows]
+
+
+async def set_job_file_id(job_id: int, file_id: str):
+    """Запоминает file_id загруженной картинки, чтобы продолжение не загружало ее снова."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return
+
+    await db_conn.execute_command(
+        "UPDATE broadcast_jobs SET file_id = ? WHERE job_id = ?", (file_id, job_id)
+    )
+
+
+async def finish_job(job_id: int):
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return
+
+    await db_conn.execute_command(
+        "UPDATE broadcast_jobs SET status = 'done', finished_at = ? WHERE job_id = ?",
+        (time.time(), job_id),
+    )
+
+
+class DeliveryLog:
+    """Buffers per-recipient delivery results and writes them in bulk.
+
+    Results are flushed with one ``executemany`` every ``flush_interval``
+    seconds or as soon as ``batch_size`` of them are buffered, so after a crash
+    at most the last interval worth of recipients is sent again on resume.
+    ``on_flush`` runs after every periodic flush (e.g. to renew the job lease).
+    """
+
+    def __init__(
+        self,
+        job_id: int,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        on_flush: Optional[Callable[[], Awaitable]] = None,
+    ):
+        self.job_id = job_id
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self._buffer: list[tuple[str, int, int]] = []
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: int, status: str):
+        self._buffer.append((status, self.job_id, user_id))
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        db_conn = get_db_connection()
+        if not db_conn:
+            logger.error("Database connection not initialized")
+            return
+        try:
+            await db_conn.execute_many(
+                "UPDATE broadcast_deliveries SET status = ? WHERE job_id = ? AND user_id = ?",
+                batch,
+            )
+        except Exception as e:
+            logger.error(f"Не удалось записать журнал доставки рассылки {self.job_id}: {e}")
+            self._buffer[:0] = batch
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+            if self._closing:
+                break
+            if self.on_flush is not None:
+                try:
+                    await self.on_flush()
+                except Exception as e:
+                    logger.error(f"Ошибка периодического обработчика рассылки {self.job_id}: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Останавливает периодическую запись и записывает остаток буфера."""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -1,28 +1,186 @@
+import asyncio
+import time
 import aiosqlite
 import logging
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterator
+
+from database.write_queue import WriteBehindQueue
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class StorageProfile:
+    """SQLite pragmas applied to every pooled connection."""
+
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 64 * 1024 * 1024  # bytes
+    cache_size: int = -16000  # negative value means KiB, i.e. ~16 MB
+    busy_timeout: int = 5000  # milliseconds
+    temp_store: str = "MEMORY"
+
+    def pragmas(self) -> list[str]:
+        """Returns the PRAGMA statements for this profile."""
+        return [
+            f"PRAGMA journal_mode = {self.journal_mode}",
+            f"PRAGMA synchronous = {self.synchronous}",
+            f"PRAGMA mmap_size = {int(self.mmap_size)}",
+            f"PRAGMA cache_size = {int(self.cache_size)}",
+            f"PRAGMA busy_timeout = {int(self.busy_timeout)}",
+            f"PRAGMA temp_store = {self.temp_store}",
+        ]
+
+
 class DatabaseConnection:
-    """Centralized database connection manager for the application."""
+    """Centralized database connection manager for the application.
 
-    def __init__(self, database_path: str):
+    Keeps a long-lived pool of connections: a single writer (SQLite allows
+    only one writer at a time anyway) and several readers.
+    """
+
+    def __init__(
+        self,
+        database_path: str,
+        pool_size: int = 4,
+        health_check_interval: float = 60.0,
+        storage_profile: StorageProfile | None = None,
+    ):
         self.database_path = database_path
+        self.storage_profile = storage_profile or StorageProfile()
+        self.pool_size = max(1, pool_size)
+        self.health_check_interval = health_check_interval
+
+        self._writer: aiosqlite.Connection | None = None
+        self._writer_lock = asyncio.Lock()
+        self._writer_last_used = 0.0
+        self._readers: asyncio.Queue | None = None
+        self._reader_conns: list[aiosqlite.Connection] = []
+        self._open_lock = asyncio.Lock()
+        self._closed = False
+        self._write_queue: WriteBehindQueue | None = None
+
+    async def _connect(self, readonly: bool = False) -> aiosqlite.Connection:
+        """Opens a new connection to the database and applies the storage profile."""
+        conn = await aiosqlite.connect(
+            self.database_path, timeout=self.storage_profile.busy_timeout / 1000
+        )
+        for pragma in self.storage_profile.pragmas():
+            await conn.execute(pragma)
+        if readonly:
+            await conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    async def open(self):
+        """Открывает пул соединений, если он еще не открыт. После close() пул не переоткрывается."""
+        if self._closed:
+            raise RuntimeError("Database connection pool is closed")
+        if self._writer is not None:
+            return
+        async with self._open_lock:
+            if self._closed:
+                raise RuntimeError("Database connection pool is closed")
+            if self._writer is not None:
+                return
+            self._writer = await self._connect()
+            self._writer_last_used = time.monotonic()
+            self._readers = asyncio.Queue()
+            for _ in range(self.pool_size):
+                conn = await self._connect(readonly=True)
+                self._reader_conns.append(conn)
+                self._readers.put_nowait((conn, time.monotonic()))
+        logger.info(
+            f"Пул соединений с БД открыт: 1 writer, {self.pool_size} readers."
+        )
+
+    def start_write_queue(self, max_batch: int = 100, max_delay: float = 0.005):
+        """Включает пакетную запись: команды копятся max_delay секунд и коммитятся одной транзакцией."""
+        if self._write_queue is None:
+            self._write_queue = WriteBehindQueue(self, max_batch, max_delay)
+        self._write_queue.start()
+
+    async def close(self):
+        """Закрывает все соединения пула; закрытый пул больше не открывается."""
+        if self._write_queue is not None:
+            await self._write_queue.stop()
+        # Under the open lock, so an open() in progress finishes and its connections are closed here
+        async with self._open_lock:
+            self._closed = True
+        if self._writer is None:
+            return
+        async with self._writer_lock:
+            for conn in self._reader_conns:
+                try:
+                    await conn.close()
+                except Exception as e:
+                    logger.warning(f"Error closing reader connection: {e}")
+            self._reader_conns = []
+            self._readers = None
+            try:
+                await self._writer.execute("PRAGMA optimize")
+                await self._writer.close()
+            except Exception as e:
+                logger.warning(f"Error closing writer connection: {e}")
+            self._writer = None
+        logger.info("Пул соединений с БД закрыт.")
+
+    async def _ensure_healthy(
+        self, conn: aiosqlite.Connection, last_used: float, readonly: bool = False
+    ) -> aiosqlite.Connection:
+        """Checks a connection that has been idle for a while and reopens it if it is broken."""
+        if time.monotonic() - last_used < self.health_check_interval:
+            return conn
+        try:
+            async with conn.execute("SELECT 1") as cursor:
+                await cursor.fetchone()
+            return conn
+        except Exception as e:
+            logger.warning(f"Соединение с БД не прошло проверку, переподключаемся: {e}")
+            try:
+                await conn.close()
+            except Exception:
+                pass
+            return await self._connect(readonly)
 
     @asynccontextmanager
     async def get_db(self) -> AsyncGenerator[aiosqlite.Connection, None]:
-        """Provides a database connection context."""
-        async with aiosqlite.connect(self.database_path) as db:
-            yield db
+        """Provides the pooled writer connection context."""
+        await self.open()
+        async with self._writer_lock:
+            if self._closed or self._writer is None:
+                raise RuntimeError("Database connection pool is closed")
+            self._writer = await self._ensure_healthy(
+                self._writer, self._writer_last_used
+            )
+            try:
+                yield self._writer
+            finally:
+                self._writer_last_used = time.monotonic()
+
+    @asynccontextmanager
+    async def get_reader(self) -> AsyncGenerator[aiosqlite.Connection, None]:
+        """Provides a pooled read-only connection context."""
+        await self.open()
+        readers = self._readers
+        if self._closed or readers is None:
+            raise RuntimeError("Database connection pool is closed")
+        conn, last_used = await readers.get()
+        healthy = conn
+        try:
+            healthy = await self._ensure_healthy(conn, last_used, readonly=True)
+            if healthy is not conn:
+                self._reader_conns[self._reader_conns.index(conn)] = healthy
+            yield healthy
+        finally:
+            readers.put_nowait((healthy, time.monotonic()))
 
     async def init_db(self):
         """Инициализирует базу данных и создает таблицы, если они не существуют."""
         async with self.get_db() as db:
-            # Configure database to use UTC
-            await db.execute("PRAGMA timezone = 'UTC'")
+            async with db.execute("PRAGMA journal_mode") as cursor:
+                journal_mode = (await cursor.fetchone())[0]
 
             # Таблица для подписчиков
             await db.execute("""
@@ -33,6 +191,21 @@ class DatabaseConnection:
                     timezone TEXT DEFAULT 'UTC'
                 )
             """)
+            # Миграция: минута доставки и момент следующей доставки (unix time, UTC)
+            async with db.execute("PRAGMA table_info(users)") as cursor:
+                user_columns = {row[1] for row in await cursor.fetchall()}
+            if "daily_cat_minute" not in user_columns:
+                await db.execute(
+                    "ALTER TABLE users ADD COLUMN daily_cat_minute INTEGER DEFAULT 0"
+                )
+            if "next_delivery_at" not in user_columns:
+                await db.execute("ALTER TABLE users ADD COLUMN next_delivery_at INTEGER")
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_users_next_delivery ON users (next_delivery_at)"
+            )
+            # Доставка идет по next_delivery_at; индексы старой почасовой выборки не нужны
+            await db.execute("DROP INDEX IF EXISTS idx_users_utc_hour")
+            await db.execute("DROP INDEX IF EXISTS idx_users_timezone_time")
             # Таблица для всех пользователей, которые использовали бота
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS bot_users (
@@ -40,21 +213,104 @@ class DatabaseConnection:
                     first_used_at TIMESTAMP DEFAULT (datetime('now', 'utc'))
                 )
             """)
+            # Рассылки и журнал доставки по получателям (для продолжения после перезапуска)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    photo TEXT NOT NULL,
+                    caption TEXT,
+                    file_id TEXT,
+                    status TEXT NOT NULL DEFAULT 'running',
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )
+            """)
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status "
+                "ON broadcast_jobs (status, created_at)"
+            )
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                    job_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    photo TEXT,
+                    PRIMARY KEY (job_id, user_id)
+                ) WITHOUT ROWID
+            """)
+            # Миграция: своя картинка для каждого получателя (NULL — картинка рассылки)
+            async with db.execute("PRAGMA table_info(broadcast_deliveries)") as cursor:
+                delivery_columns = {row[1] for row in await cursor.fetchall()}
+            if "photo" not in delivery_columns:
+                await db.execute("ALTER TABLE broadcast_deliveries ADD COLUMN photo TEXT")
+            # Последние картинки каждого пользователя: кольцо 64-битных ключей в BLOB
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS image_history (
+                    user_id INTEGER PRIMARY KEY,
+                    ring BLOB NOT NULL,
+                    pos INTEGER NOT NULL
+                )
+            """)
+            # Аренды задач планировщика: только одна реплика выполняет каждую задачу
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS scheduler_leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
             await db.commit()
-        logger.info("База данных успешно инициализирована.")
+            await db.execute("PRAGMA optimize")
+        logger.info(
+            f"База данных успешно инициализирована (journal_mode={journal_mode})."
+        )
 
     async def execute_query(self, query: str, params: tuple = ()) -> list:
         """Execute a SELECT query and return results."""
-        async with self.get_db() as db:
+        async with self.get_reader() as db:
             async with db.execute(query, params) as cursor:
                 rows = await cursor.fetchall()
                 return list(rows)
 
-    async def execute_command(self, query: str, params: tuple = ()) -> None:
-        """Execute an INSERT/UPDATE/DELETE command."""
+    async def iterate_query(
+        self, query: str, params: tuple = (), batch_size: int = 1000
+    ) -> AsyncIterator[tuple]:
+        """Execute a SELECT query and stream its rows without loading them all into memory."""
+        async with self.get_reader() as db:
+            async with db.execute(query, params) as cursor:
+                while True:
+                    rows = await cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+
+    async def execute_command(self, query: str, params: tuple = ()) -> int:
+        """Execute an INSERT/UPDATE/DELETE command and return the number of affected rows."""
+        if self._write_queue is not None and self._write_queue.running:
+            return await self._write_queue.submit(query, params)
         async with self.get_db() as db:
-            await db.execute(query, params)
-            await db.commit()
+            try:
+                cursor = await db.execute(query, params)
+                await db.commit()
+                return cursor.rowcount
+            except Exception:
+                await db.rollback()
+                raise
+
+    async def execute_many(self, query: str, params_seq: list) -> int:
+        """Execute a command for every parameter tuple in one transaction."""
+        if self._write_queue is not None and self._write_queue.running:
+            return await self._write_queue.submit(query, params_seq, many=True)
+        async with self.get_db() as db:
+            try:
+                cursor = await db.executemany(query, params_seq)
+                await db.commit()
+                return cursor.rowcount
+            except Exception:
+                await db.rollback()
+                raise
 
 
 # Global database instance
@@ -67,8 +323,15 @@ def get_db_connection() -> DatabaseConnection | None:
     return _db_instance
 
 
-def init_db_connection(database_path: str) -> DatabaseConnection:
+def init_db_connection(
+    database_path: str,
+    pool_size: int = 4,
+    health_check_interval: float = 60.0,
+    storage_profile: StorageProfile | None = None,
+) -> DatabaseConnection:
     """Initialize the global database connection instance."""
     global _db_instance
-    _db_instance = DatabaseConnection(database_path)
+    _db_instance = DatabaseConnection(
+        database_path, pool_size, health_check_interval, storage_profile
+    )
     return _db_instance
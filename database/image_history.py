@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import struct
+from typing import Dict, Iterable, Mapping, Optional, Sequence
+
+from database.connection import get_db_connection
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Не больше стольких параметров в одном запросе с IN (...)
+_IN_CHUNK = 500
+_EMPTY = 0  # ключ пустой ячейки кольца
+
+_history_size = 32
+# Кэш истории: user_id -> ImageRing
+_history_cache = TTLCache(maxsize=10000, ttl=3600.0)
+
+
+def image_key(image: str) -> int:
+    """64-bit hash of an image identifier (its URL; TheCatAPI URLs embed the image id)."""
+    key = int.from_bytes(hashlib.blake2b(image.encode(), digest_size=8).digest(), "little")
+    return key or 1
+
+
+class ImageRing:
+    """The last ``size`` images a user received, as a ring of 64-bit keys.
+
+    Membership is checked against a key -> count map, so lookups are O(1)
+    and memory per user is bounded by ``size``. The ring is stored in SQLite
+    as a packed little-endian blob plus the write position.
+    """
+
+    __slots__ = ("keys", "pos", "_counts")
+
+    def __init__(self, size: int):
+        self.keys = [_EMPTY] * max(1, size)
+        self.pos = 0
+        self._counts: Dict[int, int] = {}
+
+    @classmethod
+    def from_blob(cls, size: int, blob: bytes, pos: int) -> "ImageRing":
+        """Restores a ring; if ``size`` has changed since, the newest keys are kept."""
+        stored = list(struct.unpack(f"<{len(blob) // 8}Q", blob[: len(blob) // 8 * 8]))
+        pos = pos % len(stored) if stored else 0
+        ring = cls(size)
+        for key in stored[pos:] + stored[:pos]:  # oldest first
+            if key != _EMPTY:
+                ring.add_key(key)
+        return ring
+
+    def to_blob(self) -> bytes:
+        return struct.pack(f"<{len(self.keys)}Q", *self.keys)
+
+    def __contains__(self, image: str) -> bool:
+        return image_key(image) in self._counts
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, image: str):
+        self.add_key(image_key(image))
+
+    def add_key(self, key: int):
+        old = self.keys[self.pos]
+        if old != _EMPTY:
+            count = self._counts[old] - 1
+            if count:
+                self._counts[old] = count
+            else:
+                del self._counts[old]
+        self.keys[self.pos] = key
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self.pos = (self.pos + 1) % len(self.keys)
+
+
+def configure_image_history(size: int, cache_size: int):
+    """Задает длину истории картинок на пользователя и размер кэша истории."""
+    global _history_size, _history_cache
+    _history_size = max(1, size)
+    _history_cache = TTLCache(maxsize=cache_size, ttl=3600.0)
+
+
+async def get_histories(user_ids: Sequence[int]) -> Dict[int, ImageRing]:
+    """Возвращает историю картинок пользователей (из кэша или одним запросом на пачку).
+
+    При ошибке БД история считается пустой и не кэшируется.
+    """
+    histories: Dict[int, ImageRing] = {}
+    missing = []
+    for user_id in user_ids:
+        ring = _history_cache.get(user_id)
+        if ring is not None:
+            histories[user_id] = ring
+        else:
+            missing.append(user_id)
+    if not missing:
+        return histories
+
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return {**histories, **{user_id: ImageRing(_history_size) for user_id in missing}}
+
+    loaded: Dict[int, ImageRing] = {}
+    try:
+        for start in range(0, len(missing), _IN_CHUNK):
+            chunk = missing[start:start + _IN_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = await db_conn.execute_query(
+                f"SELECT user_id, ring, pos FROM image_history WHERE user_id IN ({placeholders})",
+                tuple(chunk),
+            )
+            for user_id, blob, pos in rows:
+                loaded[user_id] = ImageRing.from_blob(_history_size, blob, pos)
+    except Exception as e:
+        logger.error(f"Не удалось загрузить историю картинок: {e}")
+        return {**histories, **{user_id: ImageRing(_history_size) for user_id in missing}}
+
+    for user_id in missing:
+        # Someone may have cached (and changed) the history while we were reading;
+        # an empty ring is falsy, so compare with None
+        ring = _history_cache.get(user_id)
+        if ring is None:
+            ring = loaded.get(user_id)
+            if ring is None:
+                ring = ImageRing(_history_size)
+            _history_cache.set(user_id, ring)
+        histories[user_id] = ring
+    return histories
+
+
+async def get_history(user_id: int) -> ImageRing:
+    return (await get_histories([user_id]))[user_id]
+
+
+async def save_histories(histories: Mapping[int, ImageRing]):
+    """Записывает измененные истории одной пачкой."""
+    if not histories:
+        return
+    db_conn = get_db_connection()
+    if not db_conn:
+        raise RuntimeError("Database connection not initialized")
+
+    await db_conn.execute_many(
+        "INSERT INTO image_history (user_id, ring, pos) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET ring = excluded.ring, pos = excluded.pos",
+        [(user_id, ring.to_blob(), ring.pos) for user_id, ring in histories.items()],
+    )
+
+
+async def record_images(images: Iterable[tuple[int, str]]):
+    """Добавляет отправленные картинки в историю пользователей: пары (user_id, image)."""
+    images = list(images)
+    histories = await get_histories([user_id for user_id, _ in images])
+    changed: Dict[int, ImageRing] = {}
+    for user_id, image in images:
+        ring = histories[user_id]
+        ring.add(image)
+        changed[user_id] = ring
+    try:
+        await save_histories(changed)
+    except Exception as e:
+        logger.error(f"Не удалось сохранить историю картинок: {e}")
+
+
+async def record_image(user_id: int, image: Optional[str]):
+    if image:
+        await record_images([(user_id, image)])
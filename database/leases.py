@@ -0,0 +1,87 @@
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Optional, Protocol
+
+from database.connection import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Уникальный идентификатор этого процесса среди реплик бота
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Expired leases are kept for a while so that a late replica still sees the key as taken
+_PURGE_AFTER = 24 * 3600
+
+
+class LeaseBackend(Protocol):
+    """Storage for named leases shared by all replicas."""
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        """Takes or extends the lease; returns False if another holder owns it."""
+        ...
+
+    async def release(self, name: str, holder: str):
+        ...
+
+
+class SQLiteLeaseBackend:
+    """Leases in the bot's SQLite database (replicas must share the database file)."""
+
+    async def acquire(self, name: str, holder: str, ttl: float) -> bool:
+        db_conn = get_db_connection()
+        if not db_conn:
+            raise RuntimeError("Database connection not initialized")
+
+        now = time.time()
+        # One atomic upsert: insert a new lease, or take over an expired one / extend our own
+        acquired = await db_conn.execute_command(
+            """
+            INSERT INTO scheduler_leases (name, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                holder = excluded.holder,
+                expires_at = excluded.expires_at
+            WHERE scheduler_leases.expires_at < ? OR scheduler_leases.holder = excluded.holder
+            """,
+            (name, holder, now + ttl, now),
+        )
+        if acquired:
+            await db_conn.execute_command(
+                "DELETE FROM scheduler_leases WHERE expires_at < ?", (now - _PURGE_AFTER,)
+            )
+        return bool(acquired)
+
+    async def release(self, name: str, holder: str):
+        db_conn = get_db_connection()
+        if not db_conn:
+            raise RuntimeError("Database connection not initialized")
+        await db_conn.execute_command(
+            "DELETE FROM scheduler_leases WHERE name = ? AND holder = ?", (name, holder)
+        )
+
+
+_backend: LeaseBackend = SQLiteLeaseBackend()
+
+
+def set_lease_backend(backend: LeaseBackend):
+    """Подменяет хранилище аренд (например, на Redis при общей инфраструктуре)."""
+    global _backend
+    _backend = backend
+
+
+async def acquire_lease(name: str, ttl: float, holder: Optional[str] = None) -> bool:
+    """Пытается захватить аренду; при ошибке хранилища считает, что аренда не получена."""
+    try:
+        return await _backend.acquire(name, holder or INSTANCE_ID, ttl)
+    except Exception as e:
+        logger.error(f"Не удалось захватить аренду {name}: {e}")
+        return False
+
+
+async def release_lease(name: str, holder: Optional[str] = None):
+    try:
+        await _backend.release(name, holder or INSTANCE_ID)
+    except Exception as e:
+        logger.error(f"Не удалось освободить аренду {name}: {e}")
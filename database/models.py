@@ -17,6 +17,7 @@ class User:
     timezone: Optional[str] = (
         "UTC"  # User's timezone (e.g. 'Europe/Moscow', 'America/New_York')
     )
+    daily_cat_minute: Optional[int] = 0  # Minute of the delivery hour (0-59)
 
     @classmethod
     def from_row(cls, row):
@@ -31,6 +32,23 @@ class User:
                 subscribed_at=subscribed_at,
                 daily_cat_time=daily_cat_time,
             )
+        elif len(row) == 4:
+            user_id, subscribed_at, daily_cat_time, timezone = row
+            return cls(
+                user_id=user_id,
+                subscribed_at=subscribed_at,
+                daily_cat_time=daily_cat_time,
+                timezone=timezone,
+            )
+        elif len(row) == 5:
+            user_id, subscribed_at, daily_cat_time, timezone, daily_cat_minute = row
+            return cls(
+                user_id=user_id,
+                subscribed_at=subscribed_at,
+                daily_cat_time=daily_cat_time,
+                timezone=timezone,
+                daily_cat_minute=daily_cat_minute,
+            )
         else:
             raise ValueError(f"Invalid row format: {row}")
 
@@ -47,3 +65,28 @@ class BotUser:
         """Create a BotUser instance from a database row."""
         user_id, first_used_at = row
         return cls(user_id=user_id, first_used_at=first_used_at)
+
+
+@dataclass
+class BroadcastJob:
+    """Represents a persisted broadcast (one daily-cat run)."""
+
+    job_id: int
+    name: str
+    photo: str
+    caption: Optional[str] = None
+    file_id: Optional[str] = None
+    created_at: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row):
+        """Create a BroadcastJob instance from a database row."""
+        job_id, name, photo, caption, file_id, created_at = row
+        return cls(
+            job_id=job_id,
+            name=name,
+            photo=photo,
+            caption=caption,
+            file_id=file_id,
+            created_at=created_at,
+        )
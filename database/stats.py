@@ -0,0 +1,54 @@
+import logging
+from database.connection import get_db_connection
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBERS = "subscribers"
+BOT_USERS = "bot_users"
+
+_COUNT_QUERIES = {
+    SUBSCRIBERS: "SELECT COUNT(*) FROM users",
+    BOT_USERS: "SELECT COUNT(*) FROM bot_users",
+}
+
+# Счетчики живут недолго и дополнительно подправляются при каждой записи
+_counts = TTLCache(maxsize=len(_COUNT_QUERIES), ttl=60.0)
+
+
+async def _get_count(key: str) -> int:
+    count = _counts.get(key)
+    if count is not None:
+        return count
+
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return 0
+
+    try:
+        rows = await db_conn.execute_query(_COUNT_QUERIES[key])
+        count = rows[0][0]
+        _counts.set(key, count)
+        return count
+    except Exception as e:
+        logger.error(f"Error counting {key}: {e}")
+        return 0
+
+
+async def get_subscriber_count() -> int:
+    """Возвращает количество подписчиков (SELECT COUNT(*) с коротким кэшем)."""
+    return await _get_count(SUBSCRIBERS)
+
+
+async def get_bot_user_count() -> int:
+    """Возвращает количество всех пользователей бота (SELECT COUNT(*) с коротким кэшем)."""
+    return await _get_count(BOT_USERS)
+
+
+def adjust_count(key: str, delta: int):
+    """Подправляет закэшированный счетчик после изменения таблицы."""
+    count = _counts.get(key)
+    if count is not None and delta:
+        _counts.replace(key, max(0, count + delta))
+
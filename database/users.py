@@ -1,9 +1,91 @@
 import logging
-from typing import List
+from datetime import datetime
+from typing import AsyncIterator, Callable, Iterable, List
 from database.connection import get_db_connection
+from database.models import User
+from database.stats import SUBSCRIBERS, adjust_count
+from utils.cache import TTLCache
+from utils.timezones import next_occurrence
 
 logger = logging.getLogger(__name__)
 
+# Кэш состояния подписчиков: user_id -> User, либо None для неподписанных
+_user_cache = TTLCache(maxsize=10000, ttl=300.0)
+_MISSING = object()
+# Счетчики записей по полосам user_id: чтение, во время которого в его полосе
+# была запись, не попадает в кэш (иначе оно вернуло бы туда старое состояние)
+_WRITE_STRIPES = 1024
+_user_writes = [0] * _WRITE_STRIPES
+# Не больше стольких параметров в одном запросе с IN (...)
+_IN_CHUNK = 500
+
+# Слушатель изменений расписания: (user_id, next_delivery_at или None при отписке)
+_delivery_listener: Callable[[int, int | None], None] | None = None
+
+
+def configure_user_cache(maxsize: int, ttl: float):
+    """Задает размер и время жизни кэша состояния подписчиков."""
+    global _user_cache
+    _user_cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+
+def set_delivery_listener(listener: Callable[[int, int | None], None] | None):
+    """Регистрирует функцию, которую вызывают при изменении момента доставки пользователю."""
+    global _delivery_listener
+    _delivery_listener = listener
+
+
+def _user_written(user_id: int):
+    """Marks a committed write of the user, so reads that started before it are not cached."""
+    _user_writes[user_id % _WRITE_STRIPES] += 1
+
+
+def _notify_delivery(user_id: int, next_delivery_at: int | None):
+    if _delivery_listener is not None:
+        try:
+            _delivery_listener(user_id, next_delivery_at)
+        except Exception as e:
+            logger.error(f"Ошибка слушателя расписания для {user_id}: {e}")
+
+
+async def _get_user(user_id: int) -> User | None:
+    """Возвращает подписчика из кэша или из базы; None, если пользователь не подписан.
+
+    Ошибки БД пробрасываются и не кэшируются.
+    """
+    user = _user_cache.get(user_id, _MISSING)
+    if user is not _MISSING:
+        return user
+
+    db_conn = get_db_connection()
+    if not db_conn:
+        raise RuntimeError("Database connection not initialized")
+
+    version = _user_writes[user_id % _WRITE_STRIPES]
+    rows = await db_conn.execute_query(
+        "SELECT user_id, subscribed_at, daily_cat_time, timezone, daily_cat_minute "
+        "FROM users WHERE user_id = ?",
+        (user_id,),
+    )
+    user = User.from_row(rows[0]) if rows else None
+    if _user_writes[user_id % _WRITE_STRIPES] == version:
+        _user_cache.set(user_id, user)
+    return user
+
+
+def _compute_next_delivery(
+    daily_cat_time: int, daily_cat_minute: int, timezone: str, after: datetime | None = None
+) -> int | None:
+    """Вычисляет момент следующей доставки (unix time) для локального времени пользователя."""
+    try:
+        return next_occurrence(daily_cat_time, daily_cat_minute or 0, timezone, after)
+    except Exception as e:
+        logger.error(
+            f"Не удалось вычислить время доставки для "
+            f"{daily_cat_time}:{daily_cat_minute or 0:02d} ({timezone}): {e}"
+        )
+        return None
+
 
 async def is_user_subscribed(user_id: int) -> bool:
     """Проверяет, подписан ли пользователь."""
@@ -13,17 +95,17 @@ async def is_user_subscribed(user_id: int) -> bool:
         return False
 
     try:
-        rows = await db_conn.execute_query(
-            "SELECT 1 FROM users WHERE user_id = ?", (user_id,)
-        )
-        return len(rows) > 0
+        return await _get_user(user_id) is not None
     except Exception as e:
         logger.error(f"Error checking if user is subscribed: {e}")
         return False
 
 
 async def add_user(
-    user_id: int, daily_cat_time: int = 9, timezone: str = "Europe/Moscow"
+    user_id: int,
+    daily_cat_time: int = 9,
+    timezone: str = "Europe/Moscow",
+    daily_cat_minute: int = 0,
 ):
     """Добавляет пользователя в базу данных (подписывает на рассылку)."""
     db_conn = get_db_connection()
@@ -32,14 +114,31 @@ async def add_user(
         return
 
     try:
+        next_delivery_at = _compute_next_delivery(daily_cat_time, daily_cat_minute, timezone)
         await db_conn.execute_command(
-            "INSERT INTO users (user_id, daily_cat_time, timezone) VALUES (?, ?, ?)",
-            (user_id, daily_cat_time, timezone),
+            "INSERT INTO users (user_id, daily_cat_time, daily_cat_minute, timezone, "
+            "next_delivery_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, daily_cat_time, daily_cat_minute, timezone, next_delivery_at),
         )
+        adjust_count(SUBSCRIBERS, 1)
+        _user_written(user_id)
+        _user_cache.set(
+            user_id,
+            User(
+                user_id=user_id,
+                daily_cat_time=daily_cat_time,
+                timezone=timezone,
+                daily_cat_minute=daily_cat_minute,
+            ),
+        )
+        _notify_delivery(user_id, next_delivery_at)
         logger.info(
-            f"Пользователь {user_id} подписался на рассылку с временем {daily_cat_time}:00 (по {timezone})."
+            f"Пользователь {user_id} подписался на рассылку с временем "
+            f"{daily_cat_time}:{daily_cat_minute:02d} (по {timezone})."
         )
     except Exception as e:
+        _user_written(user_id)
+        _user_cache.pop(user_id)
         if "UNIQUE constraint failed" in str(e):
             logger.warning(f"Попытка повторной подписки пользователя {user_id}.")
         else:
@@ -54,9 +153,17 @@ async def remove_user(user_id: int):
         return
 
     try:
-        await db_conn.execute_command("DELETE FROM users WHERE user_id = ?", (user_id,))
+        deleted = await db_conn.execute_command(
+            "DELETE FROM users WHERE user_id = ?", (user_id,)
+        )
+        adjust_count(SUBSCRIBERS, -deleted)
+        _user_written(user_id)
+        _user_cache.set(user_id, None)
+        _notify_delivery(user_id, None)
         logger.info(f"Пользователь {user_id} отписался от рассылки.")
     except Exception as e:
+        _user_written(user_id)
+        _user_cache.pop(user_id)
         logger.error(f"Error removing user: {e}")
 
 
@@ -75,24 +182,51 @@ async def get_all_users() -> List[int]:
         return []
 
 
-async def get_users_with_times() -> List[tuple]:
-    """Возвращает список кортежей (user_id, daily_cat_time, timezone) для всех подписанных пользователей."""
+async def get_users_page(
+    anchor: int | None = None, direction: str = "next", limit: int = 50
+) -> tuple[List[int], bool]:
+    """Возвращает страницу ID подписчиков после (next) или до (prev) anchor и признак, что дальше есть еще."""
     db_conn = get_db_connection()
     if not db_conn:
         logger.error("Database connection not initialized")
-        return []
+        return [], False
 
     try:
+        if direction == "prev":
+            rows = await db_conn.execute_query(
+                "SELECT user_id FROM users WHERE user_id < ? ORDER BY user_id DESC LIMIT ?",
+                (anchor, limit + 1),
+            )
+            rows.reverse()
+            has_more = len(rows) > limit
+            return [row[0] for row in rows[-limit:]], has_more
         rows = await db_conn.execute_query(
-            "SELECT user_id, daily_cat_time, timezone FROM users"
+            "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (anchor if anchor is not None else -1, limit + 1),
         )
-        return [(row[0], row[1], row[2]) for row in rows]
+        return [row[0] for row in rows[:limit]], len(rows) > limit
     except Exception as e:
-        logger.error(f"Error getting users with times: {e}")
-        return []
+        logger.error(f"Error getting users page: {e}")
+        return [], False
 
 
-async def update_user_time(user_id: int, daily_cat_time: int):
+async def iter_users(with_details: bool = False) -> AsyncIterator[tuple]:
+    """Построчно выдает подписчиков: (user_id,) или (user_id, subscribed_at, daily_cat_time, daily_cat_minute, timezone)."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return
+
+    columns = (
+        "user_id, subscribed_at, daily_cat_time, daily_cat_minute, timezone"
+        if with_details
+        else "user_id"
+    )
+    async for row in db_conn.iterate_query(f"SELECT {columns} FROM users ORDER BY user_id"):
+        yield row
+
+
+async def update_user_time(user_id: int, daily_cat_time: int, daily_cat_minute: int = 0):
     """Обновляет время получения ежедневного кота для пользователя."""
     db_conn = get_db_connection()
     if not db_conn:
@@ -100,12 +234,20 @@ async def update_user_time(user_id: int, daily_cat_time: int):
         return
 
     try:
-        await db_conn.execute_command(
-            "UPDATE users SET daily_cat_time = ? WHERE user_id = ?",
-            (daily_cat_time, user_id),
+        timezone = await get_user_timezone(user_id)
+        next_delivery_at = _compute_next_delivery(daily_cat_time, daily_cat_minute, timezone)
+        updated = await db_conn.execute_command(
+            "UPDATE users SET daily_cat_time = ?, daily_cat_minute = ?, "
+            "next_delivery_at = ? WHERE user_id = ?",
+            (daily_cat_time, daily_cat_minute, next_delivery_at, user_id),
         )
+        _user_written(user_id)
+        _user_cache.pop(user_id)
+        if updated:
+            _notify_delivery(user_id, next_delivery_at)
         logger.info(
-            f"Время получения кота для пользователя {user_id} обновлено на {daily_cat_time}:00 (по UTC)."
+            f"Время получения кота для пользователя {user_id} обновлено на "
+            f"{daily_cat_time}:{daily_cat_minute:02d} (по {timezone})."
         )
     except Exception as e:
         logger.error(f"Error updating user time: {e}")
@@ -119,11 +261,9 @@ async def get_user_timezone(user_id: int) -> str:
         return "Europe/Moscow"  # Default timezone
 
     try:
-        rows = await db_conn.execute_query(
-            "SELECT timezone FROM users WHERE user_id = ?", (user_id,)
-        )
-        if rows:
-            return rows[0][0]  # Return the timezone from the first row
+        user = await _get_user(user_id)
+        if user is not None:
+            return user.timezone  # Return the subscriber's timezone
         else:
             return "Europe/Moscow"  # Default timezone if user not found
     except Exception as e:
@@ -139,10 +279,135 @@ async def update_user_timezone(user_id: int, timezone: str):
         return
 
     try:
-        await db_conn.execute_command(
-            "UPDATE users SET timezone = ? WHERE user_id = ?",
-            (timezone, user_id),
+        user = await _get_user(user_id)
+        daily_cat_time = user.daily_cat_time if user is not None else 9
+        daily_cat_minute = user.daily_cat_minute if user is not None else 0
+        next_delivery_at = _compute_next_delivery(daily_cat_time, daily_cat_minute, timezone)
+        updated = await db_conn.execute_command(
+            "UPDATE users SET timezone = ?, next_delivery_at = ? WHERE user_id = ?",
+            (timezone, next_delivery_at, user_id),
         )
+        _user_written(user_id)
+        _user_cache.pop(user_id)
+        if updated:
+            _notify_delivery(user_id, next_delivery_at)
         logger.info(f"Timezone for user {user_id} updated to {timezone}.")
     except Exception as e:
         logger.error(f"Error updating user timezone: {e}")
+
+
+async def refresh_next_deliveries() -> int:
+    """Заполняет момент следующей доставки там, где он еще не вычислен (после миграции).
+
+    Расчет идет по уникальным сочетаниям (таймзона, час, минута).
+    Возвращает количество обновленных пользователей.
+    """
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return 0
+
+    try:
+        rows = await db_conn.execute_query(
+            "SELECT DISTINCT timezone, daily_cat_time, daily_cat_minute FROM users "
+            "WHERE next_delivery_at IS NULL"
+        )
+        updated = 0
+        for timezone, daily_cat_time, daily_cat_minute in rows:
+            next_delivery_at = _compute_next_delivery(daily_cat_time, daily_cat_minute, timezone)
+            if next_delivery_at is None:
+                continue
+            updated += await db_conn.execute_command(
+                "UPDATE users SET next_delivery_at = ? WHERE next_delivery_at IS NULL "
+                "AND timezone = ? AND daily_cat_time = ? AND daily_cat_minute IS ?",
+                (next_delivery_at, timezone, daily_cat_time, daily_cat_minute),
+            )
+        if updated:
+            logger.info(f"Время следующей доставки заполнено для {updated} пользователей.")
+        return updated
+    except Exception as e:
+        logger.error(f"Error refreshing next deliveries: {e}")
+        return 0
+
+
+async def get_deliveries_between(start: int, end: int) -> List[tuple]:
+    """Подписчики с доставкой в [start, end): (user_id, next_delivery_at, timezone, час, минута)."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return []
+
+    try:
+        return await db_conn.execute_query(
+            "SELECT user_id, next_delivery_at, timezone, daily_cat_time, daily_cat_minute "
+            "FROM users WHERE next_delivery_at >= ? AND next_delivery_at < ? "
+            "ORDER BY next_delivery_at",
+            (start, end),
+        )
+    except Exception as e:
+        logger.error(f"Error getting deliveries: {e}")
+        return []
+
+
+async def get_due_deliveries(user_ids: Iterable[int], start: int, end: int) -> List[tuple]:
+    """Те из ``user_ids``, чья доставка все еще в [start, end): строки как у get_deliveries_between.
+
+    Поиск по первичному ключу, пачками по _IN_CHUNK пользователей.
+    """
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return []
+
+    user_ids = list(user_ids)
+    rows = []
+    try:
+        for offset in range(0, len(user_ids), _IN_CHUNK):
+            chunk = user_ids[offset:offset + _IN_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            rows.extend(
+                await db_conn.execute_query(
+                    "SELECT user_id, next_delivery_at, timezone, daily_cat_time, daily_cat_minute "
+                    f"FROM users WHERE user_id IN ({placeholders}) "
+                    "AND next_delivery_at >= ? AND next_delivery_at < ?",
+                    (*chunk, start, end),
+                )
+            )
+    except Exception as e:
+        logger.error(f"Error getting due deliveries: {e}")
+        return []
+    rows.sort(key=lambda row: row[1])
+    return rows
+
+
+def compute_next_deliveries(rows: Iterable[tuple], after: datetime) -> List[tuple[int, int]]:
+    """Для строк get_deliveries_between возвращает пары (next_delivery_at, user_id) после ``after``."""
+    computed: dict[tuple, int | None] = {}
+    result = []
+    for user_id, _, timezone, daily_cat_time, daily_cat_minute in rows:
+        key = (timezone, daily_cat_time, daily_cat_minute)
+        if key not in computed:
+            computed[key] = _compute_next_delivery(
+                daily_cat_time, daily_cat_minute, timezone, after
+            )
+        if computed[key] is not None:
+            result.append((computed[key], user_id))
+    return result
+
+
+async def reschedule_deliveries(schedule: List[tuple[int, int]]) -> int:
+    """Записывает новые моменты доставки: пары (next_delivery_at, user_id)."""
+    db_conn = get_db_connection()
+    if not db_conn:
+        logger.error("Database connection not initialized")
+        return 0
+
+    if not schedule:
+        return 0
+    try:
+        return await db_conn.execute_many(
+            "UPDATE users SET next_delivery_at = ? WHERE user_id = ?", schedule
+        )
+    except Exception as e:
+        logger.error(f"Error rescheduling deliveries: {e}")
+        return 0
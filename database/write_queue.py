@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from database.connection import DatabaseConnection
+
+logger = logging.getLogger(__name__)
+
+
+class _Write:
+    __slots__ = ("query", "params", "many", "future")
+
+    def __init__(self, query: str, params, many: bool, future: asyncio.Future):
+        self.query = query
+        self.params = params
+        self.many = many
+        self.future = future
+
+
+class WriteBehindQueue:
+    """Groups concurrent write commands into a single transaction.
+
+    Commands are collected for up to ``max_delay`` seconds or until
+    ``max_batch`` of them are queued, then executed and committed together.
+    Every command gets its own future with the affected row count (or its
+    own error), so a failing statement does not fail the rest of the batch.
+    """
+
+    def __init__(self, db: "DatabaseConnection", max_batch: int = 100, max_delay: float = 0.005):
+        self.db = db
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self._queue: asyncio.Queue[_Write | None] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает очередь, предварительно записав все накопленные команды."""
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        self._queue.put_nowait(None)
+        await task
+
+    def submit(self, query: str, params=(), many: bool = False) -> asyncio.Future:
+        """Ставит команду в очередь и возвращает future с количеством затронутых строк."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_Write(query, params, many, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            write = await self._queue.get()
+            if write is None:
+                break
+            batch = [write]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    write = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if write is None:
+                    # Stop requested: flush what we have and exit
+                    stopping = True
+                    break
+                batch.append(write)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Ошибка записи пакета команд в БД: {e}")
+
+    async def _flush(self, batch: list[_Write]):
+        """Executes a batch of commands in one transaction."""
+        results: list[tuple[_Write, int]] = []
+        try:
+            async with self.db.get_db() as conn:
+                try:
+                    for write in batch:
+                        try:
+                            if write.many:
+                                cursor = await conn.executemany(write.query, write.params)
+                            else:
+                                cursor = await conn.execute(write.query, write.params)
+                            results.append((write, cursor.rowcount))
+                        except Exception as e:
+                            # Only this statement is rolled back, the transaction goes on
+                            if not write.future.done():
+                                write.future.set_exception(e)
+                    await conn.commit()
+                except BaseException:
+                    await conn.rollback()
+                    raise
+        except BaseException as e:
+            for write in batch:
+                if not write.future.done():
+                    write.future.set_exception(
+                        e if isinstance(e, Exception) else RuntimeError("Write was cancelled")
+                    )
+            raise
+        for write, rowcount in results:
+            if not write.future.done():
+                write.future.set_result(rowcount)
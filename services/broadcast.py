@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Mapping, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+from aiogram.types import Message
+
+from services.photo_cache import as_input_photo, get_file_id, remember_from_message
+
+logger = logging.getLogger(__name__)
+
+
+# BadRequest descriptions that mean the chat itself is unreachable
+_GONE_CHAT_ERRORS = ("chat not found", "user not found", "peer_id_invalid")
+
+
+def _recipient_gone(error: Exception) -> bool:
+    """True if the recipient blocked the bot or no longer exists (not a content error)."""
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    description = (getattr(error, "message", "") or "").lower()
+    return any(marker in description for marker in _GONE_CHAT_ERRORS)
+
+
+class TokenBucket:
+    """Asyncio token bucket limiter with support for a global pause (flood control)."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a token is available and takes it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Blocks all acquirers for the given number of seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+@dataclass
+class BroadcastStats:
+    """Result counters of a single broadcast run."""
+
+    total: int = 0
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    target_rate: float = 0.0
+    started: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def backlog(self) -> int:
+        """Recipients that are still waiting for their message."""
+        return max(0, self.total - self.processed)
+
+    @property
+    def eta(self) -> float:
+        """Estimated seconds until the broadcast is done (observed speed, else the target rate)."""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        if self.processed and elapsed > 0:
+            return self.backlog / (self.processed / elapsed)
+        return self.backlog / self.target_rate if self.target_rate else 0.0
+
+
+class BroadcastEngine:
+    """Sends a photo to many chats with a bounded worker pool and Telegram rate limits.
+
+    Telegram allows roughly 30 messages per second in total and about one
+    message per second to the same chat; both limits are enforced here. The
+    total limit belongs to the bot, not to one broadcast, so engines that run
+    at the same time should share one ``limiter``.
+
+    With ``pace_window`` set, a broadcast is not sent as fast as possible but at
+    a steady rate that spreads it over that many seconds (never above ``rate``),
+    so load stays flat instead of spiking at the start of every slot. Pacing is
+    applied on top of the shared limiter.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = 20,
+        rate: float = 25.0,
+        per_chat_rate: float = 1.0,
+        max_retries: int = 3,
+        progress_interval: float = 10.0,
+        upload_attempts: int = 3,
+        pace_window: float = 0.0,
+        limiter: Optional[TokenBucket] = None,
+    ):
+        self.bot = bot
+        self.workers = max(1, workers)
+        self.rate = rate
+        self.pace_window = pace_window
+        self.stats: Optional[BroadcastStats] = None
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.upload_attempts = upload_attempts
+        self.per_chat_interval = 1.0 / per_chat_rate if per_chat_rate > 0 else 0.0
+        self.limiter = limiter if limiter is not None else TokenBucket(rate)
+        self._pacer: Optional[TokenBucket] = None
+        self._chat_last_sent: dict[int, float] = {}
+        self._upload_locks: dict[str, asyncio.Lock] = {}
+        self._upload_failures: dict[str, int] = {}
+
+    async def _wait_for_chat(self, chat_id: int):
+        """Respects the per-chat limit."""
+        if not self.per_chat_interval:
+            return
+        last = self._chat_last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._chat_last_sent[chat_id] = time.monotonic()
+
+    @staticmethod
+    def _finish(
+        chat_id: int,
+        status: str,
+        stats: BroadcastStats,
+        on_result: Optional[Callable[[int, str], None]],
+    ):
+        """Counts the outcome of one recipient ("sent", "blocked" or "failed")."""
+        setattr(stats, status, getattr(stats, status) + 1)
+        if on_result is not None:
+            on_result(chat_id, status)
+
+    async def _send(
+        self,
+        chat_id: int,
+        photo,
+        caption: Optional[str],
+        stats: BroadcastStats,
+        on_blocked: Optional[Callable[[int], Awaitable]],
+        on_result: Optional[Callable[[int, str], None]] = None,
+    ) -> Optional[Message]:
+        """Sends one photo, retrying after flood-control errors."""
+        for attempt in range(self.max_retries + 1):
+            if self._pacer is not None:
+                await self._pacer.acquire()
+            await self.limiter.acquire()
+            await self._wait_for_chat(chat_id)
+            try:
+                message = await self.bot.send_photo(
+                    chat_id=chat_id, photo=photo, caption=caption
+                )
+                self._finish(chat_id, "sent", stats, on_result)
+                return message
+            except TelegramRetryAfter as e:
+                stats.retries += 1
+                logger.warning(
+                    f"Flood control при отправке {chat_id}, пауза {e.retry_after} с "
+                    f"(попытка {attempt + 1}/{self.max_retries + 1})."
+                )
+                self.limiter.pause(e.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                if not _recipient_gone(e):
+                    # Bad photo, file_id or caption: the recipient is fine, keep them subscribed
+                    self._finish(chat_id, "failed", stats, on_result)
+                    logger.error(f"Telegram отклонил сообщение для {chat_id}: {e.message}")
+                    return None
+                self._finish(chat_id, "blocked", stats, on_result)
+                logger.warning(
+                    f"Пользователь {chat_id} заблокировал бота или чат не найден."
+                )
+                if on_blocked is not None:
+                    await on_blocked(chat_id)
+                return None
+            except Exception as e:
+                self._finish(chat_id, "failed", stats, on_result)
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                return None
+        self._finish(chat_id, "failed", stats, on_result)
+        logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: исчерпаны попытки.")
+        return None
+
+    async def _report_progress(self, stats: BroadcastStats, started: float):
+        """Periodically logs broadcast progress."""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            elapsed = time.monotonic() - started
+            speed = stats.processed / elapsed if elapsed else 0.0
+            logger.info(
+                f"Рассылка: {stats.processed}/{stats.total} "
+                f"(отправлено {stats.sent}, заблокировано {stats.blocked}, "
+                f"ошибок {stats.failed}), {speed:.1f} сообщ./с, "
+                f"осталось {stats.backlog}, ~{stats.eta:.0f} с."
+            )
+
+    async def _send_url(
+        self,
+        chat_id: int,
+        url: str,
+        caption: Optional[str],
+        stats: BroadcastStats,
+        on_blocked: Optional[Callable[[int], Awaitable]],
+        on_result: Optional[Callable[[int, str], None]],
+    ) -> Optional[Message]:
+        """Sends an image by URL (or local path), uploading each image only once.
+
+        The first recipient of an image uploads it while other recipients of the
+        same image wait; everybody after that gets the cached file_id. After
+        ``upload_attempts`` failed uploads the image is sent without waiting.
+        """
+        file_id = get_file_id(url)
+        if file_id is None and self._upload_failures.get(url, 0) < self.upload_attempts:
+            lock = self._upload_locks.setdefault(url, asyncio.Lock())
+            async with lock:
+                file_id = get_file_id(url)
+                if file_id is None and self._upload_failures.get(url, 0) < self.upload_attempts:
+                    message = await self._send(
+                        chat_id, as_input_photo(url), caption, stats, on_blocked, on_result
+                    )
+                    if remember_from_message(url, message) is None:
+                        self._upload_failures[url] = self._upload_failures.get(url, 0) + 1
+                    return message
+        photo = file_id or as_input_photo(url)
+        return await self._send(chat_id, photo, caption, stats, on_blocked, on_result)
+
+    async def broadcast(
+        self,
+        chat_ids: Iterable[int],
+        photo,
+        caption: Optional[str] = None,
+        on_blocked: Optional[Callable[[int], Awaitable]] = None,
+        on_result: Optional[Callable[[int, str], None]] = None,
+        photos: Optional[Mapping[int, str]] = None,
+    ) -> BroadcastStats:
+        """Sends the photo to every chat and returns the run statistics.
+
+        ``photos`` may assign a different image URL to some recipients; the
+        rest get ``photo``. ``on_result`` is called with the chat id and its
+        outcome ("sent", "blocked" or "failed") once per recipient.
+
+        Every image given by URL (or local path) is uploaded once and the
+        returned file_id is used for its other recipients, so Telegram does
+        not re-download the image.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for chat_id in chat_ids:
+            queue.put_nowait(chat_id)
+        stats = BroadcastStats(total=queue.qsize())
+        if not stats.total:
+            return stats
+
+        stats.target_rate = self.rate
+        if self.pace_window > 0:
+            # Steady pace without bursts: finish in about pace_window seconds
+            stats.target_rate = min(self.rate, stats.total / self.pace_window)
+            self._pacer = TokenBucket(stats.target_rate, capacity=1)
+        started = stats.started = time.monotonic()
+        self.stats = stats
+        photos = photos or {}
+
+        async def worker():
+            while True:
+                try:
+                    chat_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                chat_photo = photos.get(chat_id, photo)
+                try:
+                    if isinstance(chat_photo, str):
+                        await self._send_url(
+                            chat_id, chat_photo, caption, stats, on_blocked, on_result
+                        )
+                    else:
+                        await self._send(
+                            chat_id, chat_photo, caption, stats, on_blocked, on_result
+                        )
+                except Exception as e:
+                    self._finish(chat_id, "failed", stats, on_result)
+                    logger.error(f"Ошибка воркера рассылки для {chat_id}: {e}")
+
+        reporter = asyncio.create_task(self._report_progress(stats, started))
+        try:
+            await asyncio.gather(
+                *(worker() for _ in range(min(self.workers, stats.total)))
+            )
+        finally:
+            reporter.cancel()
+            self._pacer = None
+            self._chat_last_sent.clear()
+            self._upload_locks.clear()
+            self._upload_failures.clear()
+        stats.elapsed = time.monotonic() - started
+        return stats
@@ -1,22 +1,169 @@
+import asyncio
 import logging
 import aiohttp
 
+from services.resilience import CircuitBreaker, retry_async
+
 logger = logging.getLogger(__name__)
 
 
+def _is_retryable(error: BaseException) -> bool:
+    """Network errors, timeouts, 429 and 5xx responses are worth retrying."""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class CatApiClient:
+    """Process-wide TheCatAPI client that keeps one pooled HTTP session."""
+
+    BASE_URL = "https://api.thecatapi.com/v1"
+    # /images/search returns at most this many images per request (with an API key)
+    MAX_PAGE_SIZE = 100
+
+    def __init__(
+        self,
+        api_key: str,
+        limit_per_host: int = 10,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30.0,
+        total_timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        retries: int = 3,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 5.0,
+        breaker_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+    ):
+        self.api_key = api_key
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout, connect=connect_timeout
+        )
+        self.retries = retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.breaker = CircuitBreaker(
+            "TheCatAPI", breaker_threshold, breaker_reset_timeout
+        )
+        self._session: aiohttp.ClientSession | None = None
+        self._lock = asyncio.Lock()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Returns the shared session, creating it on first use."""
+        if self._session is not None and not self._session.closed:
+            return self._session
+        async with self._lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit_per_host=self.limit_per_host,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    keepalive_timeout=self.keepalive_timeout,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=self.timeout,
+                    headers={"x-api-key": self.api_key},
+                )
+        return self._session
+
+    async def close(self):
+        """Закрывает HTTP-сессию."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def search_images(self, limit: int = 1, attempts: int | None = None) -> list[dict]:
+        """Запрашивает случайные картинки с котами (/v1/images/search) с повторами.
+
+        Пока circuit breaker открыт, сразу выбрасывает CircuitOpenError.
+        """
+        return await retry_async(
+            lambda: self._search_images(limit),
+            attempts=self.retries if attempts is None else attempts,
+            base_delay=self.retry_base_delay,
+            max_delay=self.retry_max_delay,
+            breaker=self.breaker,
+            retry_on=_is_retryable,
+        )
+
+    async def fetch_images(
+        self, count: int, concurrency: int = 4, attempts: int | None = None
+    ) -> list[dict]:
+        """Fetches up to ``count`` distinct images with concurrent pages of MAX_PAGE_SIZE.
+
+        Failed pages are skipped; an error is raised only if no page succeeded.
+        """
+        pages = -(-count // self.MAX_PAGE_SIZE)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def fetch_page(limit: int) -> list[dict]:
+            async with semaphore:
+                return await self.search_images(limit=limit, attempts=attempts)
+
+        results = await asyncio.gather(
+            *(fetch_page(min(self.MAX_PAGE_SIZE, count)) for _ in range(pages)),
+            return_exceptions=True,
+        )
+        images: list[dict] = []
+        seen: set[str] = set()
+        errors = []
+        for result in results:
+            if isinstance(result, BaseException):
+                errors.append(result)
+                continue
+            for item in result:
+                image_id = str(item.get("id") or item["url"])
+                if image_id not in seen:
+                    seen.add(image_id)
+                    images.append(item)
+        if errors:
+            if not images:
+                raise errors[0]
+            logger.warning(f"{len(errors)} из {pages} запросов картинок завершились ошибкой")
+        return images[:count]
+
+    async def _search_images(self, limit: int) -> list[dict]:
+        session = await self._get_session()
+        params = {"limit": limit} if limit > 1 else None
+        async with session.get(f"{self.BASE_URL}/images/search", params=params) as response:
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    message=f"Ошибка API TheCatApi: Статус {response.status}",
+                )
+            return await response.json()
+
+
+# Global client instance
+_client: CatApiClient | None = None
+
+
+def get_cat_api_client() -> CatApiClient | None:
+    """Get the global TheCatAPI client instance."""
+    return _client
+
+
+def init_cat_api_client(api_key: str, **kwargs) -> CatApiClient:
+    """Initialize the global TheCatAPI client instance."""
+    global _client
+    _client = CatApiClient(api_key, **kwargs)
+    return _client
+
+
 async def get_cat_image_url(api_key: str) -> str | None:
     """Получает URL случайной картинки с котом."""
-    url = "https://api.thecatapi.com/v1/images/search"
-    headers = {"x-api-key": api_key}
+    client = _client or init_cat_api_client(api_key)
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data[0]["url"]
-                else:
-                    logger.error(f"Ошибка API TheCatApi: Статус {response.status}")
-                    return None
+        data = await client.search_images()
+        return data[0]["url"]
+    except aiohttp.ClientResponseError as e:
+        logger.error(e.message)
+        return None
     except Exception as e:
         logger.error(f"Не удалось получить картинку с котом: {e}")
         return None
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import os
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import Container, Optional
+
+from services.cat_api import CatApiClient, get_cat_image_url
+from services.image_cache import prefetch_images
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatImage:
+    """A ready-to-send cat image from TheCatAPI."""
+
+    id: str
+    url: str  # remote URL or a local file path for fallback images
+
+
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+
+def load_fallback_images(directory: str | None = None, urls: list[str] | None = None) -> list[CatImage]:
+    """Собирает локальный запасной пул картинок: файлы из каталога и заданные URL."""
+    images = [CatImage(id=f"fallback:{url}", url=url) for url in urls or []]
+    if directory and os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if name.lower().endswith(_IMAGE_EXTENSIONS):
+                path = os.path.join(directory, name)
+                images.append(CatImage(id=f"fallback:{name}", url=path))
+    return images
+
+
+class CatImageReservoir:
+    """In-memory stock of cat images, refilled in batches by a background task.
+
+    When the stock runs dry and TheCatAPI is unavailable, recently served
+    images are recycled, and as a last resort a local fallback pool is used,
+    instead of failing the request.
+    """
+
+    def __init__(
+        self,
+        client: CatApiClient,
+        capacity: int = 100,
+        low_water: int = 20,
+        batch_size: int = 25,
+        recycle_size: int = 200,
+        retry_delay: float = 5.0,
+        fallback: list[CatImage] | None = None,
+    ):
+        self.client = client
+        self.capacity = capacity
+        self.low_water = low_water
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.fallback = fallback or []
+        self._ready: deque[CatImage] = deque()
+        self._ready_ids: set[str] = set()
+        self._recent: deque[CatImage] = deque(maxlen=recycle_size)
+        self._refill_needed = asyncio.Event()
+        self._refill_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._prefetch_tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._ready)
+
+    async def start(self):
+        """Запускает фоновое пополнение и делает первичное заполнение."""
+        self._task = asyncio.create_task(self._run())
+        try:
+            await self.refill()
+        except Exception as e:
+            logger.warning(f"Не удалось заполнить резерв котиков при запуске: {e}")
+            self._refill_needed.set()
+
+    async def stop(self):
+        """Останавливает фоновое пополнение."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in self._prefetch_tasks:
+            task.cancel()
+
+    async def refill(self, attempts: int | None = None) -> int:
+        """Fetches batches from TheCatAPI until the reservoir is full. Returns the number of added images."""
+        added = 0
+        async with self._refill_lock:
+            while len(self._ready) < self.capacity:
+                limit = min(self.batch_size, self.capacity - len(self._ready))
+                data = await self.client.search_images(limit=limit, attempts=attempts)
+                new = []
+                for item in data:
+                    image = CatImage(id=str(item.get("id") or item["url"]), url=item["url"])
+                    if image.id in self._ready_ids:
+                        continue
+                    self._ready.append(image)
+                    self._ready_ids.add(image.id)
+                    new.append(image.url)
+                added += len(new)
+                if not new:
+                    break
+                self._prefetch(new)
+        if added:
+            logger.info(f"Резерв котиков пополнен на {added}, всего {len(self._ready)}.")
+        return added
+
+    async def _run(self):
+        """Background loop that tops the reservoir up below the low-water mark."""
+        while True:
+            await self._refill_needed.wait()
+            self._refill_needed.clear()
+            try:
+                await self.refill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Не удалось пополнить резерв котиков: {e}")
+                await asyncio.sleep(self.retry_delay)
+                if len(self._ready) < self.low_water:
+                    self._refill_needed.set()
+
+    def _prefetch(self, urls: list[str]):
+        """Downloads new images to the disk cache (if enabled) in the background."""
+        task = asyncio.create_task(prefetch_images(urls))
+        self._prefetch_tasks.add(task)
+        task.add_done_callback(self._prefetch_tasks.discard)
+
+    async def get_pool(self, count: int, concurrency: int = 4) -> list[CatImage]:
+        """Возвращает до ``count`` разных картинок для рассылки одним пакетом запросов.
+
+        Картинки берутся из API пачками, недостающие — из резерва; если API и резерв
+        недоступны, пул состоит из одной картинки по обычной цепочке запасных вариантов.
+        """
+        pool: list[CatImage] = []
+        try:
+            data = await self.client.fetch_images(count, concurrency=concurrency, attempts=1)
+            pool = [CatImage(id=str(item.get("id") or item["url"]), url=item["url"]) for item in data]
+        except Exception as e:
+            logger.error(f"Не удалось получить пачку котиков для рассылки: {e}")
+        pool_ids = {image.id for image in pool}
+        while len(pool) < count:
+            image = self._take()
+            if image is None:
+                break
+            if image.id not in pool_ids:
+                pool.append(image)
+                pool_ids.add(image.id)
+        if not pool:
+            image = await self.get()
+            if image is not None:
+                pool.append(image)
+        return pool
+
+    def _take(self, exclude: Optional[Container[str]] = None) -> Optional[CatImage]:
+        """Takes the oldest ready image whose URL is not in ``exclude``."""
+        if not self._ready:
+            return None
+        if exclude is None:
+            image = self._ready.popleft()
+        else:
+            image = next((image for image in self._ready if image.url not in exclude), None)
+            if image is None:
+                return None
+            self._ready.remove(image)
+        self._ready_ids.discard(image.id)
+        self._recent.append(image)
+        if len(self._ready) < self.low_water:
+            self._refill_needed.set()
+        return image
+
+    async def get(self, exclude: Optional[Container[str]] = None) -> Optional[CatImage]:
+        """Возвращает готовую картинку; при пустом резерве и недоступном API повторяет недавнюю.
+
+        Картинки с URL из ``exclude`` (например, истории пользователя) выдаются,
+        только если других нет.
+        """
+        image = self._take(exclude)
+        if image is not None:
+            return image
+        try:
+            # A single attempt: the caller is waiting, retries are left to the background task
+            await self.refill(attempts=1)
+        except Exception as e:
+            logger.error(f"Не удалось получить котиков для резерва: {e}")
+        image = self._take(exclude) or self._take()
+        if image is not None:
+            return image
+        if self._recent:
+            logger.warning("Резерв котиков пуст, отправляем недавнюю картинку.")
+            return _choose(self._recent, exclude)
+        if self.fallback:
+            logger.warning("Резерв котиков пуст, отправляем картинку из запасного пула.")
+            return _choose(self.fallback, exclude)
+        return None
+
+
+def _choose(images, exclude: Optional[Container[str]]) -> CatImage:
+    """Случайная картинка, по возможности не из ``exclude``."""
+    if exclude is not None:
+        unseen = [image for image in images if image.url not in exclude]
+        if unseen:
+            return random.choice(unseen)
+    return random.choice(images)
+
+
+# Global reservoir instance
+_reservoir: CatImageReservoir | None = None
+
+
+def get_cat_reservoir() -> CatImageReservoir | None:
+    """Get the global cat image reservoir."""
+    return _reservoir
+
+
+def init_cat_reservoir(client: CatApiClient, **kwargs) -> CatImageReservoir:
+    """Initialize the global cat image reservoir."""
+    global _reservoir
+    _reservoir = CatImageReservoir(client, **kwargs)
+    return _reservoir
+
+
+async def get_random_cat_url(api_key: str, exclude: Optional[Container[str]] = None) -> str | None:
+    """Получает URL картинки с котом из резерва (или напрямую из API, если резерв не запущен).
+
+    ``exclude`` — URL, которые лучше не повторять (история картинок пользователя).
+    """
+    if _reservoir is None:
+        return await get_cat_image_url(api_key)
+    image = await _reservoir.get(exclude)
+    return image.url if image else None
+
+
+async def get_cat_pool(api_key: str, count: int, concurrency: int = 4) -> list[CatImage]:
+    """Получает пул разных картинок для рассылки (или одну, если резерв не запущен)."""
+    if _reservoir is None:
+        url = await get_cat_image_url(api_key)
+        return [CatImage(id=url, url=url)] if url else []
+    return await _reservoir.get_pool(count, concurrency)
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+from collections import OrderedDict
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_INDEX_FILE = "index.json"
+_DEFAULT_EXTENSION = ".jpg"
+# Telegram does not accept photos larger than 10 MB anyway
+_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+
+class ImageDiskCache:
+    """Content-addressed on-disk copy of remote images with LRU eviction by size.
+
+    Every image is stored once under ``<directory>/<aa>/<sha256><ext>``, no
+    matter how many URLs point to it, and the least recently used files are
+    removed when the total size exceeds ``max_bytes``. The URL -> digest
+    mapping and the LRU order are kept in memory and saved to ``index.json``
+    on stop; files that are not in the index are picked up on start.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        concurrency: int = 4,
+        timeout: float = 10.0,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        # digest -> (path, size), least recently used first
+        self._files: "OrderedDict[str, tuple[str, int]]" = OrderedDict()
+        self._urls: dict[str, str] = {}
+        self._total = 0
+        self._downloads: dict[str, asyncio.Task] = {}
+        self._session: aiohttp.ClientSession | None = None
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    async def start(self):
+        """Создает каталог и восстанавливает индекс уже скачанных картинок."""
+        await asyncio.to_thread(self._load)
+        self._evict()
+        logger.info(
+            f"Дисковый кэш картинок: {len(self._files)} файлов, "
+            f"{self._total / 2**20:.1f} из {self.max_bytes / 2**20:.0f} МБ."
+        )
+
+    async def stop(self):
+        """Дожидается начатых загрузок, сохраняет индекс и закрывает HTTP-сессию."""
+        if self._downloads:
+            await asyncio.gather(*self._downloads.values(), return_exceptions=True)
+        try:
+            await asyncio.to_thread(self._save_index)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить индекс кэша картинок: {e}")
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def get_path(self, url: str) -> Optional[str]:
+        """Local file of an already downloaded image (marks it as recently used)."""
+        digest = self._urls.get(url)
+        if digest is None or digest not in self._files:
+            return None
+        self._files.move_to_end(digest)
+        return self._files[digest][0]
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """Скачивает картинку, если ее еще нет на диске; возвращает путь или None при ошибке.
+
+        Одновременные запросы одного URL ждут одну и ту же загрузку.
+        """
+        path = self.get_path(url)
+        if path is not None:
+            return path
+        task = self._downloads.get(url)
+        if task is None:
+            task = asyncio.create_task(self._download(url))
+            self._downloads[url] = task
+            task.add_done_callback(lambda _: self._downloads.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def prefetch(self, urls: Iterable[str]):
+        """Скачивает картинки, которых еще нет на диске (ошибки только логируются)."""
+        await asyncio.gather(
+            *(self.fetch(url) for url in urls if _is_remote(url) and self.get_path(url) is None)
+        )
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # A separate session: the TheCatAPI client sends the API key with every request
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def _download(self, url: str) -> Optional[str]:
+        try:
+            async with self._semaphore:
+                session = await self._get_session()
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    # With Content-Encoding the header counts compressed bytes, not the image
+                    expected = response.content_length
+                    if response.headers.get("Content-Encoding"):
+                        expected = None
+                    if (expected or 0) > _MAX_IMAGE_BYTES:
+                        raise ValueError(f"картинка больше {_MAX_IMAGE_BYTES} байт")
+                    body = bytearray()
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        body += chunk
+                        if len(body) > _MAX_IMAGE_BYTES:
+                            raise ValueError(f"картинка больше {_MAX_IMAGE_BYTES} байт")
+                    if not body or (expected is not None and len(body) != expected):
+                        raise ValueError(
+                            f"получено {len(body)} байт вместо {expected}, картинка обрезана"
+                        )
+                    content_type = response.content_type
+            body = bytes(body)
+            extension = _extension(url, content_type)
+            digest = hashlib.sha256(body).hexdigest()
+            if digest not in self._files:
+                path = os.path.join(self.directory, digest[:2], digest + extension)
+                await asyncio.to_thread(_write_atomic, path, body)
+                self._files[digest] = (path, len(body))
+                self._total += len(body)
+            self._urls[url] = digest
+            self._files.move_to_end(digest)
+            self._evict()
+            return self.get_path(url)
+        except Exception as e:
+            logger.warning(f"Не удалось сохранить картинку {url} в кэш: {e}")
+            return None
+
+    def _evict(self):
+        """Removes least recently used files until the cache fits into ``max_bytes``."""
+        removed = []
+        while self._total > self.max_bytes and len(self._files) > 1:
+            digest, (path, size) = self._files.popitem(last=False)
+            self._total -= size
+            removed.append(digest)
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить {path} из кэша картинок: {e}")
+        if removed:
+            gone = set(removed)
+            self._urls = {url: digest for url, digest in self._urls.items() if digest not in gone}
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found: dict[str, tuple[str, int, float]] = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                digest, extension = os.path.splitext(name)
+                if len(digest) != 64 or not extension:
+                    continue  # index.json, unfinished temporary files
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found[digest] = (path, stat.st_size, stat.st_mtime)
+
+        order: list[str] = []
+        try:
+            with open(os.path.join(self.directory, _INDEX_FILE), encoding="utf-8") as f:
+                index = json.load(f)
+            order = [digest for digest in index.get("lru", []) if digest in found]
+            self._urls = {url: d for url, d in index.get("urls", {}).items() if d in found}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Индекс кэша картинок поврежден, собираем заново: {e}")
+
+        indexed = set(order)
+        # Files missing from the index are the oldest; among them, order by mtime
+        unindexed = sorted((d for d in found if d not in indexed), key=lambda d: found[d][2])
+        for digest in unindexed + order:
+            path, size, _ = found[digest]
+            self._files[digest] = (path, size)
+            self._total += size
+
+    def _save_index(self):
+        index = {"lru": list(self._files), "urls": self._urls}
+        _write_atomic(
+            os.path.join(self.directory, _INDEX_FILE), json.dumps(index).encode("utf-8")
+        )
+
+
+def _is_remote(url: str) -> bool:
+    return url.startswith(("http://", "https://"))
+
+
+def _extension(url: str, content_type: str) -> str:
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    if extension in (".jpg", ".jpeg", ".png", ".gif", ".webp"):
+        return extension
+    return mimetypes.guess_extension(content_type or "") or _DEFAULT_EXTENSION
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# Global cache instance (None when the disk cache is disabled)
+_image_cache: ImageDiskCache | None = None
+
+
+def get_image_cache() -> ImageDiskCache | None:
+    return _image_cache
+
+
+def init_image_cache(directory: str, max_bytes: int, **kwargs) -> ImageDiskCache:
+    """Initialize the global disk image cache."""
+    global _image_cache
+    _image_cache = ImageDiskCache(directory, max_bytes, **kwargs)
+    return _image_cache
+
+
+def get_cached_path(url: str) -> Optional[str]:
+    """Путь к локальной копии картинки или None (в том числе если кэш выключен)."""
+    if _image_cache is None:
+        return None
+    return _image_cache.get_path(url)
+
+
+async def prefetch_images(urls: Iterable[str]):
+    """Скачивает картинки в дисковый кэш, если он включен."""
+    if _image_cache is not None:
+        await _image_cache.prefetch(urls)
@@ -0,0 +1,56 @@
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from aiogram.types import FSInputFile, Message
+
+from services.image_cache import get_cached_path
+
+logger = logging.getLogger(__name__)
+
+# Maps a remote image URL to the Telegram file_id it got after the first upload
+_MAX_ENTRIES = 10000
+_file_ids: "OrderedDict[str, str]" = OrderedDict()
+
+
+def get_file_id(url: str) -> Optional[str]:
+    """Возвращает сохраненный file_id для URL картинки, если он есть."""
+    file_id = _file_ids.get(url)
+    if file_id is not None:
+        _file_ids.move_to_end(url)
+    return file_id
+
+
+def remember_file_id(url: str, file_id: str):
+    """Запоминает file_id, который Telegram присвоил картинке по URL."""
+    _file_ids[url] = file_id
+    _file_ids.move_to_end(url)
+    while len(_file_ids) > _MAX_ENTRIES:
+        _file_ids.popitem(last=False)
+
+
+def remember_from_message(url: str, message: Optional[Message]) -> Optional[str]:
+    """Extracts the file_id of the largest photo size from a sent message and caches it."""
+    if message is None or not message.photo:
+        return None
+    file_id = message.photo[-1].file_id
+    remember_file_id(url, file_id)
+    return file_id
+
+
+def as_input_photo(url: str):
+    """Returns what to pass as ``photo``: a cached file_id, a local file or the URL itself.
+
+    Images already in the disk cache are uploaded from the local copy, so
+    Telegram does not have to fetch them from the CDN.
+    """
+    file_id = get_file_id(url)
+    if file_id is not None:
+        return file_id
+    if "://" not in url and os.path.isfile(url):
+        return FSInputFile(url)
+    path = get_cached_path(url)
+    if path is not None:
+        return FSInputFile(path)
+    return url
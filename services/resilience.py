@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail fast for ``reset_timeout`` seconds; then a single trial call is let
+    through (half-open) and its result closes or reopens the circuit.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Returns True if a call may be attempted now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info(f"Circuit breaker {self.name}: сервис снова доступен.")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self.failure_threshold:
+            if self._opened_at is None or self._trial_in_flight:
+                logger.warning(
+                    f"Circuit breaker {self.name} открыт на {self.reset_timeout} с "
+                    f"после {self._failures} ошибок подряд."
+                )
+            self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """Frees the half-open trial slot when the trial ended without a result (cancelled)."""
+        self._trial_in_flight = False
+
+
+async def retry_async(
+    func: Callable[[], Awaitable[T]],
+    attempts: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 5.0,
+    breaker: Optional[CircuitBreaker] = None,
+    retry_on: Callable[[BaseException], bool] = lambda e: True,
+) -> T:
+    """Calls ``func`` with jittered exponential backoff between attempts.
+
+    Only errors accepted by ``retry_on`` are retried and counted by the breaker.
+    """
+    attempts = max(1, attempts)
+    for attempt in range(attempts):
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"Circuit breaker {breaker.name} is open")
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # A cancelled trial says nothing about the service; let the next call try
+            if breaker is not None:
+                breaker.release_trial()
+            raise
+        except Exception as e:
+            if not retry_on(e):
+                # The service did answer, so it counts as available
+                if breaker is not None:
+                    breaker.record_success()
+                raise
+            if breaker is not None:
+                breaker.record_failure()
+            if attempt == attempts - 1 or (breaker is not None and breaker.state == "open"):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            logger.warning(
+                f"Попытка {attempt + 1}/{attempts} не удалась ({e!r}), повтор через {delay:.2f} с."
+            )
+            await asyncio.sleep(delay)
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return result
+    raise AssertionError("unreachable")
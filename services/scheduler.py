@@ -1,66 +1,368 @@
+import asyncio
 import logging
+import time
+from datetime import datetime, timezone
+from typing import Container, Dict, List, Mapping, Optional, Sequence
 from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
-from database.users import get_users_with_times, remove_user
-from services.cat_api import get_cat_image_url
+from config.settings import (
+    BROADCAST_WORKERS,
+    BROADCAST_RATE,
+    BROADCAST_PER_CHAT_RATE,
+    BROADCAST_MAX_RETRIES,
+    BROADCAST_RESUME_WINDOW,
+    BROADCAST_JOB_LEASE_TTL,
+    BROADCAST_LOG_BATCH_SIZE,
+    BROADCAST_LOG_FLUSH_INTERVAL,
+    BROADCAST_PACING_WINDOW,
+    BROADCAST_IMAGE_POOL_SIZE,
+    BROADCAST_IMAGE_FETCH_CONCURRENCY,
+    DELIVERY_LEADER_TTL,
+)
+from database.broadcast_jobs import (
+    DeliveryLog,
+    abandon_stale_jobs,
+    create_job,
+    finish_job,
+    get_pending_deliveries,
+    get_unfinished_jobs,
+    set_job_file_id,
+)
+from database.image_history import ImageRing, get_histories, save_histories
+from database.leases import acquire_lease, release_lease
+from database.models import BroadcastJob
+from database.users import (
+    compute_next_deliveries,
+    get_deliveries_between,
+    get_due_deliveries,
+    remove_user,
+    reschedule_deliveries,
+    set_delivery_listener,
+)
+from services.broadcast import BroadcastEngine, BroadcastStats, TokenBucket
+from services.cat_reservoir import get_cat_pool
+from services.image_cache import prefetch_images
+from services.photo_cache import get_file_id, remember_file_id
+from services.timing_wheel import TimingWheel
 
 logger = logging.getLogger(__name__)
 
+DAILY_CAPTION = "Ваш ежедневный котик! 🐾"
 
-async def send_daily_cats(bot: Bot, db_path: str, cat_api_key: str):
-    """Функция для ежедневной рассылки котов."""
-    logger.info("Начало ежедневной рассылки...")
-    users_with_times = await get_users_with_times()
-    image_url = await get_cat_image_url(cat_api_key)
+# Только лидер (держатель аренды) ведет колесо доставок и делает рассылки
+_DELIVERY_LEASE = "delivery_leader"
 
-    if not image_url:
-        logger.error("Не удалось получить картинку для рассылки. Рассылка отменена.")
+# Рассылки, которые выполняет этот процесс (аренда у него же, повторно не запускаем)
+_active_jobs: set[int] = set()
+# Движки текущих рассылок: job name -> engine (для показа прогресса)
+_running: dict[str, BroadcastEngine] = {}
+# Общий лимит Telegram на все рассылки процесса (продолженные идут одновременно с новыми)
+_send_limiter = TokenBucket(BROADCAST_RATE)
+
+# Колесо доставок на ближайший час: user_id в слоте своей минуты
+_wheel = TimingWheel(slots=60, resolution=60)
+# Как часто сверять колесо с индексом next_delivery_at: ловит изменения расписания,
+# сделанные на других экземплярах, и давно просроченные доставки
+_RECONCILE_INTERVAL = 10 * 60
+_is_leader = False
+_fed_until = 0.0  # до какого момента подписчики из БД уже загружены в колесо
+_reconciled_at = 0.0
+_due: set[int] = set()  # снятые с колеса получатели, которых ждет отправка
+_pending = asyncio.Event()
+_sender: Optional[asyncio.Task] = None
+
+
+def _on_delivery_changed(user_id: int, next_delivery_at: Optional[int]):
+    """Keeps the wheel in sync when a subscriber changes time, timezone or unsubscribes."""
+    if not _is_leader:
+        return
+    if next_delivery_at is None:
+        _wheel.discard(user_id)
+    else:
+        _wheel.add(user_id, next_delivery_at)
+
+
+set_delivery_listener(_on_delivery_changed)
+
+
+async def _skip_missed_deliveries(before: float) -> int:
+    """Переносит на следующий день доставки, которые пропущены слишком давно.
+
+    Выполняется при каждой сверке, так что доставка, которую не удалось
+    отправить за окно продолжения, не остается просроченной навсегда.
+    """
+    rows = await get_deliveries_between(0, int(before))
+    if not rows:
+        return 0
+    schedule = _complete_schedule(rows, compute_next_deliveries(rows, datetime.now(timezone.utc)))
+    await reschedule_deliveries(schedule)
+    logger.warning(f"Пропущено {len(rows)} доставок, перенесены на следующий день.")
+    return len(rows)
+
+
+def _complete_schedule(rows: List[tuple], schedule: List[tuple]) -> List[tuple]:
+    """Subscribers whose next time cannot be computed are not scheduled again."""
+    scheduled = {user_id for _, user_id in schedule}
+    return schedule + [(None, row[0]) for row in rows if row[0] not in scheduled]
+
+
+async def _feed_wheel():
+    """Loads subscribers that came within the wheel's horizon (one indexed range query)."""
+    global _fed_until
+    horizon_end = _wheel.horizon_end()
+    if _fed_until >= horizon_end:
+        return
+    for row in await get_deliveries_between(int(_fed_until), int(horizon_end)):
+        _wheel.add(row[0], row[1])
+    _fed_until = horizon_end
+
+
+async def _reconcile_wheel(now: float):
+    """Puts every delivery that is due by the index back into the wheel's current slot.
+
+    The wheel only sees schedule changes made on this replica; the periodic
+    range query picks up the rest and anything a failed pass left behind.
+    """
+    global _reconciled_at
+    _reconciled_at = now
+    await _skip_missed_deliveries(now - BROADCAST_RESUME_WINDOW)
+    for row in await get_deliveries_between(int(now - BROADCAST_RESUME_WINDOW), int(now) + 1):
+        _wheel.add(row[0], row[1])
+
+
+async def deliver_due_cats(bot: Bot, cat_api_key: str):
+    """Ежеминутный тик: лидер отправляет котов тем, чье время доставки наступило."""
+    global _is_leader, _fed_until, _reconciled_at, _sender
+    now = time.time()
+    if not await acquire_lease(_DELIVERY_LEASE, DELIVERY_LEADER_TTL):
+        if _is_leader:
+            logger.warning("Роль лидера рассылок перешла другому экземпляру бота.")
+            _is_leader = False
+            _wheel.start(now)
+            _due.clear()
         return
 
-    from datetime import datetime, timezone
-    import pytz
+    if not _is_leader:
+        logger.info("Этот экземпляр бота стал лидером рассылок.")
+        _is_leader = True
+        _wheel.start(now)
+        _fed_until = now
+        # Доставки, пропущенные за окно продолжения, попадут в текущий слот при сверке
+        _reconciled_at = 0.0
+
+    if now - _reconciled_at >= _RECONCILE_INTERVAL:
+        await _reconcile_wheel(now)
+    await _feed_wheel()
+    due = _wheel.pop_due(now)
+    if due:
+        _due.update(due)
+        _pending.set()
+    if _pending.is_set() and (_sender is None or _sender.done()):
+        _sender = asyncio.create_task(_send_due_cats(bot, cat_api_key))
 
-    sent_count = 0
-    current_utc_hour = datetime.now(timezone.utc).hour
 
-    for user_id, daily_cat_time, user_timezone in users_with_times:
+async def _send_due_cats(bot: Bot, cat_api_key: str):
+    """Sends one broadcast job per pass until nothing is due (runs one job at a time)."""
+    while _pending.is_set() and _is_leader:
+        _pending.clear()
+        user_ids = list(_due)
+        _due.clear()
         try:
-            # Convert user's local preferred time to UTC for comparison
-            user_tz = pytz.timezone(user_timezone)
-            now = datetime.now()
-            # Create a datetime object with the user's preferred local time today
-            local_time_pref = datetime.combine(
-                now.date(), datetime.min.time().replace(hour=daily_cat_time)
-            )
-            # Localize to user's timezone
-            local_time_pref = user_tz.localize(local_time_pref)
-            # Convert to UTC to see what UTC hour this corresponds to
-            utc_time_pref = local_time_pref.astimezone(timezone.utc)
-            utc_hour_for_user = utc_time_pref.hour
-
-            # Check if the current UTC hour matches what this user should receive based on their timezone
-            if utc_hour_for_user == current_utc_hour:
-                try:
-                    await bot.send_photo(
-                        chat_id=user_id,
-                        photo=image_url,
-                        caption="Ваш ежедневный котик! 🐾",
-                    )
-                    sent_count += 1
-                except (TelegramForbiddenError, TelegramBadRequest):
-                    logger.warning(
-                        f"Пользователь {user_id} заблокировал бота или чат не найден. Удаляем из базы."
-                    )
-                    await remove_user(user_id)
-                except Exception as e:
-                    logger.error(
-                        f"Не удалось отправить сообщение пользователю {user_id}: {e}"
-                    )
+            done = await _send_due_batch(bot, cat_api_key, user_ids)
         except Exception as e:
-            logger.error(
-                f"Ошибка при обработке пользователя {user_id} в таймзоне {user_timezone}: {e}"
-            )
+            logger.error(f"Ошибка ежедневной рассылки: {e}", exc_info=True)
+            done = False
+        if not done and _is_leader:
+            # Back into the current slot: the next tick tries these recipients again
+            now = time.time()
+            for user_id in user_ids:
+                _wheel.add(user_id, now)
+
+
+async def _send_due_batch(bot: Bot, cat_api_key: str, user_ids: List[int]) -> bool:
+    """Sends to those of ``user_ids`` who are still due; False if the pass has to be retried."""
+    now = datetime.now(timezone.utc)
+    # Popped ids are checked against the table: the schedule may have changed on another replica
+    rows = await get_due_deliveries(
+        user_ids, int(now.timestamp() - BROADCAST_RESUME_WINDOW), int(now.timestamp()) + 1
+    )
+    if not rows:
+        return True
+
+    user_ids = [row[0] for row in rows]
+    pool = await get_cat_pool(
+        cat_api_key,
+        min(len(user_ids), BROADCAST_IMAGE_POOL_SIZE),
+        BROADCAST_IMAGE_FETCH_CONCURRENCY,
+    )
+    if not pool:
+        logger.error("Не удалось получить картинку для рассылки. Рассылка отложена.")
+        return False
+    urls = [image.url for image in pool]
+    # With the disk cache on, the pool is uploaded from local copies instead of the CDN
+    await prefetch_images(urls)
+    photos = _assign_images(user_ids, urls, await get_histories(user_ids))
+
+    schedule = _complete_schedule(rows, compute_next_deliveries(rows, now))
+
+    name = f"daily_cats:{now:%Y-%m-%dT%H:%M}"
+    job_id = await create_job(
+        name, urls[0], DAILY_CAPTION, user_ids, reschedule=schedule, photos=photos
+    )
+    if job_id is None:
+        logger.warning(f"Рассылка {name} уже создана, оставшихся получателей отправим со следующим тиком.")
+        return False
 
     logger.info(
-        f"Рассылка завершена. Отправлено {sent_count} из {len(users_with_times)} возможных сообщений."
+        f"Начало рассылки {name}: {len(user_ids)} получателей, {len(urls)} разных картинок."
     )
+    job = BroadcastJob(job_id=job_id, name=name, photo=urls[0], caption=DAILY_CAPTION)
+    await run_broadcast_job(bot, job, user_ids, photos)
+    return True
+
+
+def _assign_images(
+    user_ids: Sequence[int], urls: Sequence[str], recent: Mapping[int, Container[str]]
+) -> Dict[int, str]:
+    """Раздает картинки пула по кругу, пропуская те, что получатель уже видел.
+
+    Если получатель видел все картинки пула, ему достается очередная по кругу.
+    """
+    photos: Dict[int, str] = {}
+    for index, user_id in enumerate(user_ids):
+        start = index % len(urls)
+        seen = recent.get(user_id)
+        photos[user_id] = urls[start]
+        if seen:
+            for offset in range(len(urls)):
+                url = urls[(start + offset) % len(urls)]
+                if url not in seen:
+                    photos[user_id] = url
+                    break
+    return photos
+
+
+async def _remove_blocked_user(user_id: int):
+    logger.warning(f"Удаляем пользователя {user_id} из базы подписчиков.")
+    await remove_user(user_id)
+
+
+async def run_broadcast_job(
+    bot: Bot,
+    job: BroadcastJob,
+    user_ids: List[int],
+    photos: Optional[Mapping[int, str]] = None,
+):
+    """Выполняет сохраненную рассылку, записывая результат по каждому получателю.
+
+    ``photos`` — личные картинки получателей (остальным уходит ``job.photo``).
+    """
+    if job.job_id in _active_jobs:
+        return
+    _active_jobs.add(job.job_id)
+    try:
+        await _run_broadcast_job(bot, job, user_ids, photos)
+    finally:
+        _active_jobs.discard(job.job_id)
+
+
+async def _run_broadcast_job(
+    bot: Bot, job: BroadcastJob, user_ids: List[int], photos: Optional[Mapping[int, str]]
+):
+    lease_name = f"broadcast_job:{job.job_id}"
+    if not await acquire_lease(lease_name, BROADCAST_JOB_LEASE_TTL):
+        return
+
+    # Resumed jobs reuse the file_id of the first run instead of uploading again
+    if job.file_id:
+        remember_file_id(job.photo, job.file_id)
+    saved_file_id = job.file_id
+
+    photos = photos or {}
+    histories = await get_histories(user_ids)
+    changed_histories: Dict[int, ImageRing] = {}
+
+    def on_result(user_id: int, status: str):
+        delivery_log.record(user_id, status)
+        if status == "sent":
+            ring = histories[user_id]
+            ring.add(photos.get(user_id, job.photo))
+            changed_histories[user_id] = ring
+
+    async def heartbeat():
+        nonlocal saved_file_id, changed_histories
+        await acquire_lease(lease_name, BROADCAST_JOB_LEASE_TTL)
+        file_id = get_file_id(job.photo)
+        if file_id and file_id != saved_file_id:
+            await set_job_file_id(job.job_id, file_id)
+            saved_file_id = file_id
+        if changed_histories:
+            batch, changed_histories = changed_histories, {}
+            try:
+                await save_histories(batch)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить историю картинок рассылки {job.name}: {e}")
+                changed_histories = {**batch, **changed_histories}
+
+    delivery_log = DeliveryLog(
+        job.job_id,
+        batch_size=BROADCAST_LOG_BATCH_SIZE,
+        flush_interval=BROADCAST_LOG_FLUSH_INTERVAL,
+        on_flush=heartbeat,
+    )
+    engine = BroadcastEngine(
+        bot,
+        workers=BROADCAST_WORKERS,
+        rate=BROADCAST_RATE,
+        per_chat_rate=BROADCAST_PER_CHAT_RATE,
+        max_retries=BROADCAST_MAX_RETRIES,
+        pace_window=BROADCAST_PACING_WINDOW,
+        limiter=_send_limiter,
+    )
+    delivery_log.start()
+    _running[job.name] = engine
+    try:
+        stats = await engine.broadcast(
+            user_ids,
+            photo=job.photo,
+            caption=job.caption,
+            on_blocked=_remove_blocked_user,
+            on_result=on_result,
+            photos=photos,
+        )
+    finally:
+        _running.pop(job.name, None)
+        await delivery_log.close()
+    await heartbeat()
+    await finish_job(job.job_id)
+    await release_lease(lease_name)
+
+    logger.info(
+        f"Рассылка {job.name} завершена за {stats.elapsed:.1f} с. Отправлено {stats.sent} из "
+        f"{stats.total} возможных сообщений (заблокировано {stats.blocked}, "
+        f"ошибок {stats.failed}, повторов {stats.retries})."
+    )
+
+
+def get_broadcast_progress() -> List[tuple[str, BroadcastStats]]:
+    """Текущие рассылки этого экземпляра: (имя, статистика с backlog и eta)."""
+    return [
+        (name, engine.stats) for name, engine in _running.items() if engine.stats is not None
+    ]
+
+
+async def resume_broadcasts(bot: Bot):
+    """Продолжает рассылки, прерванные перезапуском или падением процесса."""
+    since = time.time() - BROADCAST_RESUME_WINDOW
+    abandoned = await abandon_stale_jobs(since)
+    if abandoned:
+        logger.warning(f"Слишком поздно продолжать {abandoned} прерванных рассылок, отменены.")
+
+    for job in await get_unfinished_jobs(since):
+        if job.job_id in _active_jobs:
+            continue
+        deliveries = await get_pending_deliveries(job.job_id)
+        user_ids = [user_id for user_id, _ in deliveries]
+        photos = {user_id: photo for user_id, photo in deliveries if photo}
+        await prefetch_images({job.photo, *photos.values()})
+        logger.info(f"Продолжаем рассылку {job.name}: осталось {len(user_ids)} получателей.")
+        await run_broadcast_job(bot, job, user_ids, photos)
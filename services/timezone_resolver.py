@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import defaultdict
+from itertools import accumulate
+from typing import Optional, Sequence
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Simplified timezone-boundary-builder polygons, see tools/build_timezone_boundaries.py
+BOUNDARIES_PATH = os.path.join(os.path.dirname(__file__), "data", "timezones.bin")
+_MAGIC = b"TZB2"
+# Value of a precomputed cell that is crossed by a border (the polygons decide)
+NO_ZONE = 0xFFFF
+
+_CELL_DEGREES = 5.0
+_LAT_CELLS = int(180 / _CELL_DEGREES)
+_LON_CELLS = int(360 / _CELL_DEGREES)
+
+# Zones newer than the installed tz database, mapped to a zone with the same current rules
+_SUBSTITUTES = {"America/Coyhaique": "America/Punta_Arenas"}
+
+_DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def _cell(lat: float, lon: float) -> tuple[int, int]:
+    row = min(_LAT_CELLS - 1, int((lat + 90) // _CELL_DEGREES))
+    col = min(_LON_CELLS - 1, int((lon + 180) // _CELL_DEGREES))
+    return row, col
+
+
+def offset_timezone(lon: float) -> str:
+    """Returns the nautical Etc/GMT zone for a longitude (note the inverted sign)."""
+    offset = max(-12, min(12, round(lon / 15)))
+    if offset == 0:
+        return "UTC"
+    return f"Etc/GMT{-offset:+d}"
+
+
+def _ring_contains(ring: array, x: int, y: int) -> bool:
+    """Even-odd ray casting over a flat ``x0, y0, x1, y1...`` ring."""
+    inside = False
+    n = len(ring)
+    px, py = ring[n - 2], ring[n - 1]
+    for i in range(0, n, 2):
+        cx, cy = ring[i], ring[i + 1]
+        if (cy > y) != (py > y) and x < (px - cx) * (y - cy) / (py - cy) + cx:
+            inside = not inside
+        px, py = cx, cy
+    return inside
+
+
+class _Polygon:
+    __slots__ = ("zone", "rings", "min_x", "min_y", "max_x", "max_y")
+
+    def __init__(self, zone: str, rings: list[array]):
+        self.zone = zone
+        self.rings = rings
+        outer = rings[0]
+        self.min_x, self.max_x = min(outer[0::2]), max(outer[0::2])
+        self.min_y, self.max_y = min(outer[1::2]), max(outer[1::2])
+
+    def area(self) -> int:
+        """Bounding box area, used to order overlapping polygons."""
+        return (self.max_x - self.min_x) * (self.max_y - self.min_y)
+
+    def contains(self, x: int, y: int) -> bool:
+        if not (self.min_x <= x <= self.max_x and self.min_y <= y <= self.max_y):
+            return False
+        if not _ring_contains(self.rings[0], x, y):
+            return False
+        return not any(_ring_contains(hole, x, y) for hole in self.rings[1:])
+
+
+class TimezoneResolver:
+    """Offline coordinate → IANA timezone lookup by point-in-polygon.
+
+    Uses the timezone-boundary-builder polygons (including the ocean zones),
+    simplified to ``tolerance`` degrees and bundled with the bot. Most points
+    are answered from a precomputed grid of ``cell_size``° cells that no
+    border crosses, a single array lookup. Only points in border cells are
+    ray cast: polygons are bucketed into a 5° lat/lon grid by bounding box,
+    so such a lookup only tests the few polygons of one bucket, smallest
+    first. Simplifying neighbouring zones independently leaves slivers along
+    shared borders; a point that falls into one gets the zone found nearest
+    around it.
+
+    The data file is small (about 2 MB), so it is read into memory once at
+    startup rather than memory-mapped; border lookups take about a
+    millisecond, so callers on the event loop run them in a thread.
+    """
+
+    def __init__(
+        self,
+        polygons: list[_Polygon],
+        scale: int,
+        tolerance: float,
+        cells: Optional[array] = None,
+        cell_size: float = 0.0,
+        zones: Sequence[str] = (),
+    ):
+        self.scale = scale
+        self.tolerance = tolerance
+        self.size = len(polygons)
+        # zone index per cell_size° cell, row by row from -90° lat and -180° lon
+        self._cells = cells
+        self._cell_units = round(cell_size * scale)
+        self._cell_cols = round(360 / cell_size) if cell_size else 0
+        self._zones = list(zones)
+        self._grid: dict[tuple[int, int], list[_Polygon]] = defaultdict(list)
+        for polygon in polygons:
+            row_min, col_min = _cell(polygon.min_y / scale, polygon.min_x / scale)
+            row_max, col_max = _cell(polygon.max_y / scale, polygon.max_x / scale)
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    self._grid[(row, col)].append(polygon)
+        # Some zones are drawn on top of a larger one (Asia/Urumqi inside Asia/Shanghai),
+        # so the smaller, more specific polygons are tested first
+        for bucket in self._grid.values():
+            bucket.sort(key=_Polygon.area)
+
+    @classmethod
+    def from_file(cls, path: str = BOUNDARIES_PATH) -> "TimezoneResolver":
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(_MAGIC):
+            raise ValueError(f"{path} is not a timezone boundary file")
+        payload = zlib.decompress(data[len(_MAGIC):])
+        (header_size,) = struct.unpack_from("<I", payload)
+        header = json.loads(payload[4:4 + header_size])
+        coords_start = 4 + header_size
+        coords_end = coords_start + 8 * header["vertices"]
+        coords = array("i")
+        coords.frombytes(payload[coords_start:coords_end])
+        cells = array("H")
+        cells.frombytes(payload[coords_end:])
+        if sys.byteorder != "little":
+            coords.byteswap()
+            cells.byteswap()
+
+        zones = [
+            name if name in pytz.all_timezones_set else _SUBSTITUTES.get(name, name)
+            for name in header["zones"]
+        ]
+        polygons = []
+        offset = 0
+        for zone_index, lengths in header["polygons"]:
+            rings = []
+            for length in lengths:
+                deltas = coords[offset:offset + 2 * length]
+                offset += 2 * length
+                ring = array("i", [0]) * (2 * length)
+                ring[0::2] = array("i", accumulate(deltas[0::2]))
+                ring[1::2] = array("i", accumulate(deltas[1::2]))
+                rings.append(ring)
+            polygons.append(_Polygon(zones[zone_index], rings))
+        logger.info(f"Загружено {len(polygons)} полигонов таймзон")
+        return cls(
+            polygons, header["scale"], header["tolerance"], cells, header["cell_size"], zones
+        )
+
+    def cell_index(self, x: int, y: int) -> int:
+        """Index in the precomputed grid of the cell holding a point in scaled units."""
+        col = min(self._cell_cols - 1, (x + 180 * self.scale) // self._cell_units)
+        row = (y + 90 * self.scale) // self._cell_units
+        return min(self._cell_cols // 2 - 1, row) * self._cell_cols + col
+
+    def _zone_at(self, lat: float, lon: float) -> Optional[str]:
+        x, y = round(lon * self.scale), round(lat * self.scale)
+        if self._cells:
+            zone_index = self._cells[self.cell_index(x, y)]
+            if zone_index != NO_ZONE:
+                return self._zones[zone_index]
+        for polygon in self._grid.get(_cell(lat, lon), ()):
+            if polygon.contains(x, y):
+                return polygon.zone
+        return None
+
+    def resolve(self, lat: float, lon: float) -> Optional[str]:
+        """Returns the IANA timezone for coordinates, or None if they are invalid."""
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        zone = self._zone_at(lat, lon)
+        if zone is not None:
+            return zone
+        # A sliver between simplified borders: the zone found closest around the point wins
+        for step in (self.tolerance / 2, self.tolerance, self.tolerance * 2):
+            found: dict[str, int] = {}
+            for d_lat, d_lon in _DIRECTIONS:
+                probe_lat = max(-90.0, min(90.0, lat + d_lat * step))
+                probe_lon = (lon + d_lon * step + 180) % 360 - 180
+                zone = self._zone_at(probe_lat, probe_lon)
+                if zone is not None:
+                    found[zone] = found.get(zone, 0) + 1
+            if found:
+                return max(found, key=found.get)
+        return offset_timezone(lon)
+
+
+_resolver: Optional[TimezoneResolver] = None
+
+
+def get_timezone_resolver() -> TimezoneResolver:
+    """Returns the resolver, loading the boundaries on first use."""
+    global _resolver
+    if _resolver is None:
+        _resolver = TimezoneResolver.from_file()
+    return _resolver
+
+
+def resolve_timezone(lat: float, lon: float) -> Optional[str]:
+    """Определяет таймзону по координатам без обращения к сети."""
+    return get_timezone_resolver().resolve(lat, lon)
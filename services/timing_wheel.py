@@ -0,0 +1,65 @@
+from typing import Hashable, List, Optional
+
+
+class TimingWheel:
+    """Hashed timing wheel: ``slots`` buckets of ``resolution`` seconds each.
+
+    Keys are placed into the bucket of their due time, so adding, moving and
+    popping a key are O(1) regardless of how many keys are scheduled. Only the
+    next ``slots * resolution`` seconds fit into the wheel; keys due later are
+    rejected and must be added again once they come within the horizon.
+    Overdue keys go into the current bucket.
+    """
+
+    def __init__(self, slots: int = 60, resolution: float = 60.0):
+        self.slots = slots
+        self.resolution = resolution
+        self._buckets: List[set] = [set() for _ in range(slots)]
+        self._ticks: dict[Hashable, int] = {}
+        self._cursor: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._ticks)
+
+    def _tick(self, timestamp: float) -> int:
+        return int(timestamp // self.resolution)
+
+    def start(self, now: float):
+        """Empties the wheel and points it at the current time."""
+        for bucket in self._buckets:
+            bucket.clear()
+        self._ticks.clear()
+        self._cursor = self._tick(now)
+
+    def horizon_end(self) -> float:
+        """The first moment that does not fit into the wheel any more."""
+        return (self._cursor + self.slots) * self.resolution
+
+    def add(self, key: Hashable, due_at: float) -> bool:
+        """Schedules (or moves) a key; returns False if it is beyond the horizon."""
+        self.discard(key)
+        tick = max(self._tick(due_at), self._cursor)
+        if tick >= self._cursor + self.slots:
+            return False
+        self._buckets[tick % self.slots].add(key)
+        self._ticks[key] = tick
+        return True
+
+    def discard(self, key: Hashable):
+        tick = self._ticks.pop(key, None)
+        if tick is not None:
+            self._buckets[tick % self.slots].discard(key)
+
+    def pop_due(self, now: float) -> list:
+        """Removes and returns every key due at or before ``now``."""
+        target = self._tick(now)
+        due = []
+        # After a long pause every bucket may be due, but each is visited only once
+        for tick in range(self._cursor, min(target + 1, self._cursor + self.slots)):
+            bucket = self._buckets[tick % self.slots]
+            for key in bucket:
+                del self._ticks[key]
+            due.extend(bucket)
+            bucket.clear()
+        self._cursor = max(self._cursor, target + 1)
+        return due
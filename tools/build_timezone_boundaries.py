@@ -0,0 +1,199 @@
+"""Builds services/data/timezones.bin from the timezone-boundary-builder polygons.
+
+The polygons are taken from the ``timezonefinder`` package (it bundles the
+timezone-boundary-builder data, ODbL), simplified with Ramer–Douglas–Peucker
+and quantized, so the bot itself does not need timezonefinder, numpy or h3.
+Run it in a separate virtualenv when the tz boundaries should be refreshed:
+
+    python -m venv /tmp/tzb && /tmp/tzb/bin/pip install timezonefinder
+    /tmp/tzb/bin/python tools/build_timezone_boundaries.py
+
+File format (zlib-compressed after the 4-byte magic ``TZB2``): a uint32
+length and a JSON header ``{"scale", "tolerance", "zones", "polygons",
+"vertices", "cell_size"}`` where every polygon is ``[zone_index,
+[ring_lengths...]]`` (outer ring first, then holes), followed by
+``vertices`` little-endian int32 coordinate pairs ``lon, lat, lon, lat...``
+in units of ``1/scale`` degrees, delta-encoded within each ring, and by a
+uint16 zone index for every ``cell_size``° cell (rows from -90° lat,
+columns from -180° lon) that no simplified border crosses, ``0xFFFF`` for
+the rest.
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import deque
+
+import numpy as np
+from timezonefinder import TimezoneFinder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from services.timezone_resolver import NO_ZONE, TimezoneResolver, _Polygon  # noqa: E402
+
+MAGIC = b"TZB2"
+SCALE = 10000  # 1e-4 degree ≈ 11 m
+CELL_SIZE = 0.25  # ≈ 28 km; smaller cells answer more points without a polygon test
+
+
+def simplify(xs: np.ndarray, ys: np.ndarray, tolerance: float) -> np.ndarray:
+    """Indices of the vertices kept by Ramer–Douglas–Peucker."""
+    n = len(xs)
+    if n <= 4:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # A closed ring has no useful base segment, so split it at the farthest vertex first
+    far = int(np.argmax((xs - xs[0]) ** 2 + (ys - ys[0]) ** 2))
+    keep[far] = True
+    stack = [(0, far), (far, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        x0, y0, x1, y1 = xs[start], ys[start], xs[end], ys[end]
+        px, py = xs[start + 1:end], ys[start + 1:end]
+        dx, dy = x1 - x0, y1 - y0
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distances = np.hypot(px - x0, py - y0)
+        else:
+            distances = np.abs(dy * (px - x0) - dx * (py - y0)) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = start + 1 + index
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+    return np.nonzero(keep)[0]
+
+
+def crossed_cells(rings: list[tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+    """Marks the cells touched by any ring edge (with a 1-unit margin around the edge)."""
+    units = round(CELL_SIZE * SCALE)
+    cols, rows = round(360 / CELL_SIZE), round(180 / CELL_SIZE)
+    crossed = np.zeros(rows * cols, dtype=bool)
+    for qx, qy in rings:
+        px, py = np.roll(qx, 1), np.roll(qy, 1)
+        c0 = np.clip((np.minimum(qx, px) - 1 + 180 * SCALE) // units, 0, cols - 1)
+        c1 = np.clip((np.maximum(qx, px) + 1 + 180 * SCALE) // units, 0, cols - 1)
+        r0 = np.clip((np.minimum(qy, py) - 1 + 90 * SCALE) // units, 0, rows - 1)
+        r1 = np.clip((np.maximum(qy, py) + 1 + 90 * SCALE) // units, 0, rows - 1)
+        single = (c0 == c1) & (r0 == r1)
+        crossed[r0[single] * cols + c0[single]] = True
+        for i in np.nonzero(~single)[0]:
+            for row in range(r0[i], r1[i] + 1):
+                crossed[row * cols + c0[i]:row * cols + c1[i] + 1] = True
+    return crossed
+
+
+def zone_cells(resolver: TimezoneResolver, crossed: np.ndarray, zones: list[str]) -> array:
+    """Zone index of every uncrossed cell: one polygon lookup per connected region."""
+    cols, rows = round(360 / CELL_SIZE), round(180 / CELL_SIZE)
+    index_of = {name: index for index, name in enumerate(zones)}
+    cells = array("H", [NO_ZONE]) * len(crossed)
+    seen = bytearray(crossed.tobytes())
+    for start in range(len(crossed)):
+        if seen[start]:
+            continue
+        row, col = divmod(start, cols)
+        zone = resolver._zone_at(-90 + (row + 0.5) * CELL_SIZE, -180 + (col + 0.5) * CELL_SIZE)
+        value = NO_ZONE if zone is None else index_of[zone]
+        seen[start] = 1
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            cells[cell] = value
+            row, col = divmod(cell, cols)
+            for neighbour in (
+                cell - cols if row > 0 else -1,
+                cell + cols if row < rows - 1 else -1,
+                cell - 1 if col > 0 else -1,
+                cell + 1 if col < cols - 1 else -1,
+            ):
+                if neighbour >= 0 and not seen[neighbour]:
+                    seen[neighbour] = 1
+                    queue.append(neighbour)
+    return cells
+
+
+def build(output: str, tolerance: float):
+    finder = TimezoneFinder()
+    zones = list(finder.timezone_names)
+    polygons = []
+    coords = array("i")
+    vertices = 0
+    # Quantized rings as the bot will see them, for the cell grid
+    rings: list[tuple[np.ndarray, np.ndarray]] = []
+    runtime_polygons: list[_Polygon] = []
+    for zone_index, name in enumerate(zones):
+        for polygon in finder.get_geometry(tz_name=name, coords_as_pairs=False):
+            lengths = []
+            polygon_rings = []
+            for ring_index, (ring_xs, ring_ys) in enumerate(polygon):
+                xs, ys = np.asarray(ring_xs, dtype=float), np.asarray(ring_ys, dtype=float)
+                vertices += len(xs)
+                kept = simplify(xs, ys, tolerance)
+                if len(kept) < 3:
+                    if ring_index == 0:
+                        break  # the whole polygon is smaller than the tolerance
+                    continue
+                qx = np.round(xs[kept] * SCALE).astype(np.int64)
+                qy = np.round(ys[kept] * SCALE).astype(np.int64)
+                pairs = np.empty(2 * len(kept), dtype=np.int64)
+                pairs[0::2] = np.diff(qx, prepend=0)
+                pairs[1::2] = np.diff(qy, prepend=0)
+                coords.extend(pairs.astype(np.int32).tolist())
+                lengths.append(len(kept))
+                rings.append((qx, qy))
+                ring = np.empty(2 * len(kept), dtype=np.int64)
+                ring[0::2], ring[1::2] = qx, qy
+                polygon_rings.append(array("i", ring.astype(np.int32).tolist()))
+            if lengths:
+                polygons.append([zone_index, lengths])
+                runtime_polygons.append(_Polygon(name, polygon_rings))
+
+    resolver = TimezoneResolver(runtime_polygons, SCALE, tolerance)
+    crossed = crossed_cells(rings)
+    cells = zone_cells(resolver, crossed, zones)
+    uniform = sum(1 for value in cells if value != NO_ZONE)
+
+    header = json.dumps(
+        {
+            "scale": SCALE,
+            "tolerance": tolerance,
+            "zones": zones,
+            "polygons": polygons,
+            "vertices": len(coords) // 2,
+            "cell_size": CELL_SIZE,
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    if sys.byteorder != "little":
+        coords.byteswap()
+        cells.byteswap()
+    payload = struct.pack("<I", len(header)) + header + coords.tobytes() + cells.tobytes()
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "wb") as f:
+        f.write(MAGIC + zlib.compress(payload, 9))
+    print(
+        f"{len(zones)} zones, {len(polygons)} polygons, {vertices} -> {len(coords) // 2} vertices, "
+        f"{uniform}/{len(cells)} cells without a border, "
+        f"{os.path.getsize(output) / 1024:.0f} KiB written to {output}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--output",
+        default=os.path.join(os.path.dirname(__file__), "..", "services", "data", "timezones.bin"),
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.002, help="simplification tolerance in degrees"
+    )
+    args = parser.parse_args()
+    build(os.path.normpath(args.output), args.tolerance)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from typing import Optional
 from aiogram import Router, F
@@ -9,14 +10,15 @@ from database.users import (
     is_user_subscribed,
     add_user,
     remove_user,
-    get_all_users,
     update_user_time,
     update_user_timezone,
     get_user_timezone,
 )
-from database.bot_users import is_bot_user, add_bot_user
+from database.image_history import get_history, record_image
 import users.keyboards as kb
-from services.cat_api import get_cat_image_url
+from services.cat_reservoir import get_random_cat_url
+from services.photo_cache import as_input_photo, remember_from_message
+from services.timezone_resolver import resolve_timezone
 
 # Main router for users
 router = Router()
@@ -93,24 +95,25 @@ async def safe_message_answer(
 
 async def safe_message_answer_photo(
     callback: CallbackQuery, photo, caption: Optional[str] = None
-) -> None:
+) -> Optional[Message]:
     """Safely send a photo in response to a callback query."""
     if callback.message is None:
         await callback.answer("Ошибка: невозможно получить сообщение.", show_alert=True)
-        return
+        return None
 
     if isinstance(callback.message, InaccessibleMessage):
         # If message is inaccessible, answer to the callback instead
         answer_text = caption if caption is not None else "Отправка фото не удалась."
         await callback.answer(answer_text, show_alert=True)
-        return
+        return None
 
     try:
-        await callback.message.answer_photo(photo=photo, caption=caption)
+        return await callback.message.answer_photo(photo=photo, caption=caption)
     except TelegramBadRequest:
         # If photo can't be sent to the original message, answer to callback
         answer_text = caption if caption is not None else "Отправка фото не удалась."
         await callback.answer(answer_text, show_alert=True)
+        return None
 
 
 @router.message(CommandStart())
@@ -119,10 +122,6 @@ async def cmd_start(message: Message, db_path: str):
         return  # Can't proceed without user info
     user_id = message.from_user.id
 
-    # Register user if first interaction
-    if not await is_bot_user(user_id):
-        await add_bot_user(user_id)
-
     is_subscribed = await is_user_subscribed(user_id)
 
     # Always show the main inline keyboard to all users
@@ -140,9 +139,11 @@ async def cmd_start(message: Message, db_path: str):
         admin_ids = get_admin_ids()
         if user_id in admin_ids:
             # Get user count for admin keyboard
-            users = await get_all_users()
-            user_count = len(users)
-            reply_keyboard = get_admin_reply_keyboard(user_count)
+            from database.stats import get_subscriber_count, get_bot_user_count
+
+            user_count = await get_subscriber_count()
+            bot_user_count = await get_bot_user_count()
+            reply_keyboard = get_admin_reply_keyboard(user_count, bot_user_count)
             await message.answer(
                 "Вы админ бота. Вот клавиатура для административных функций:",
                 reply_markup=reply_keyboard,
@@ -157,10 +158,6 @@ async def cmd_settings(message: Message, db_path: str):
         return  # Can't proceed without user info
     user_id = message.from_user.id
 
-    # Register user if first interaction
-    if not await is_bot_user(user_id):
-        await add_bot_user(user_id)
-
     # Check subscription status
     is_subscribed = await is_user_subscribed(user_id)
 
@@ -177,19 +174,19 @@ async def cmd_cat(message: Message, cat_api_key: str, db_path: str):
 
     user_id = message.from_user.id
 
-    # Register user if first interaction
-    if not await is_bot_user(user_id):
-        await add_bot_user(user_id)
-
     await message.answer("Ищу котика...", show_alert=False)
-    image_url = await get_cat_image_url(cat_api_key)
+    image_url = await get_random_cat_url(cat_api_key, exclude=await get_history(user_id))
 
     if image_url:
         try:
-            # Send the cat photo
-            await message.answer_photo(
-                photo=image_url, caption="Вот ваш случайный котик! ❤️"
+            # Send the cat photo (by file_id if Telegram already has it)
+            sent = await message.answer_photo(
+                photo=as_input_photo(image_url),
+                caption="Вот ваш случайный котик! ❤️",
             )
+            remember_from_message(image_url, sent)
+            if sent is not None:
+                await record_image(user_id, image_url)
 
             # Send the main menu again
             is_subscribed = await is_user_subscribed(user_id)
@@ -220,12 +217,6 @@ async def cmd_cat(message: Message, cat_api_key: str, db_path: str):
 
 @router.callback_query(F.data == "subscribe")
 async def cb_subscribe(callback: CallbackQuery, db_path: str):
-    user_id = callback.from_user.id
-
-    # Register user if first interaction
-    if not await is_bot_user(user_id):
-        await add_bot_user(user_id)
-
     # For new subscriptions, we'll ask for time selection
     time_keyboard = kb.get_time_selection_keyboard()
     await safe_edit_message_or_answer(
@@ -240,10 +231,6 @@ async def cb_subscribe(callback: CallbackQuery, db_path: str):
 async def cb_unsubscribe(callback: CallbackQuery, db_path: str):
     user_id = callback.from_user.id
 
-    # Register user if first interaction
-    if not await is_bot_user(user_id):
-        await add_bot_user(user_id)
-
     await remove_user(user_id)
     await callback.answer("Вы отписались от рассылки. 😿", show_alert=True)
 
@@ -254,15 +241,42 @@ async def cb_unsubscribe(callback: CallbackQuery, db_path: str):
     )
 
 
+@router.callback_query(F.data.startswith("pick_hour_"))
+async def cb_pick_hour(callback: CallbackQuery):
+    if callback.data is None:
+        await callback.answer("Ошибка: нет данных в callback.", show_alert=True)
+        return
+    try:
+        hour = int(callback.data.split("_")[2])  # "pick_hour_09"
+        minute_keyboard = kb.get_minute_selection_keyboard(hour)
+    except (IndexError, ValueError, KeyError):
+        await callback.answer("Ошибка: неверное время.", show_alert=True)
+        return
+
+    await safe_edit_message_or_answer(
+        callback,
+        f"Выберите минуту в {hour:02d} часов:",
+        reply_markup=minute_keyboard,
+    )
+    await callback.answer()
+
+
 @router.callback_query(F.data.startswith("set_time_"))
 async def cb_set_time(callback: CallbackQuery):
     user_id = callback.from_user.id
     if callback.data is None:
         await callback.answer("Ошибка: нет данных в callback.", show_alert=True)
         return
-    hour = int(
-        callback.data.split("_")[2]
-    )  # Extract hour from callback data like "set_time_09"
+    # "set_time_09_30"; old keyboards still send "set_time_09", which means 09:00
+    parts = callback.data.split("_")
+    try:
+        hour = int(parts[2])
+        minute = int(parts[3]) if len(parts) > 3 else 0
+    except (IndexError, ValueError):
+        hour = minute = -1
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        await callback.answer("Ошибка: неверное время.", show_alert=True)
+        return
 
     # Get the user's timezone
     user_timezone = await get_user_timezone(user_id)
@@ -272,16 +286,16 @@ async def cb_set_time(callback: CallbackQuery):
     # Check if user is already subscribed
     if await is_user_subscribed(user_id):
         # Update existing subscription with new time
-        await update_user_time(user_id, hour)
+        await update_user_time(user_id, hour, minute)
         await callback.answer(
-            f"Время получения кота изменено на {hour:02d}:00 (по вашему времени {user_timezone})!",
+            f"Время получения кота изменено на {hour:02d}:{minute:02d} (по вашему времени {user_timezone})!",
             show_alert=True,
         )
     else:
         # Create new subscription with selected time
-        await add_user(user_id, hour, user_timezone)  # Use user's timezone
+        await add_user(user_id, hour, user_timezone, minute)  # Use user's timezone
         await callback.answer(
-            f"Вы успешно подписались на рассылку с временем {hour:02d}:00 (по вашему времени {user_timezone})! 🎉",
+            f"Вы успешно подписались на рассылку с временем {hour:02d}:{minute:02d} (по вашему времени {user_timezone})! 🎉",
             show_alert=True,
         )
 
@@ -419,8 +433,8 @@ async def handle_user_location(message: Message):
     latitude = message.location.latitude
     longitude = message.location.longitude
 
-    # Determine timezone based on location
-    timezone = await determine_timezone_from_coordinates(latitude, longitude)
+    # Determine timezone based on location (border points are ray cast, off the event loop)
+    timezone = await asyncio.to_thread(resolve_timezone, latitude, longitude)
 
     if timezone:
         # Update the user's timezone in the database
@@ -463,60 +477,6 @@ async def handle_cancel_location(message: Message):
     )
 
 
-async def determine_timezone_from_coordinates(lat: float, lng: float) -> str:
-    """
-    Determine timezone from coordinates.
-    This is a simplified implementation. In a real application,
-    you would use a geolocation API like Google Timezone API.
-    """
-    # This is a simplified timezone determination based on longitude
-    # Each 15 degrees of longitude roughly corresponds to 1 hour difference
-
-    # Calculate the approximate UTC offset based on longitude
-    utc_offset_hours = round(lng / 15)
-
-    # Determine a timezone based on the offset
-    if -2 <= utc_offset_hours <= 2:
-        return "Europe/London"  # GMT/UTC
-    elif 3 <= utc_offset_hours <= 5:
-        return "Europe/Moscow"  # Moscow time
-    elif 6 <= utc_offset_hours <= 8:
-        return "Asia/Yekaterinburg"
-    elif 9 <= utc_offset_hours <= 11:
-        return "Asia/Vladivostok"
-    elif 12 <= utc_offset_hours <= 14:
-        return "Asia/Kamchatka"
-    elif -3 <= utc_offset_hours <= -1:
-        return "Europe/London"  # Western European time
-    elif -4 <= utc_offset_hours <= -6:
-        return "America/New_York"  # US Eastern time
-    elif -7 <= utc_offset_hours <= -9:
-        return "America/Los_Angeles"  # US Pacific time
-    elif -10 <= utc_offset_hours <= -12:
-        return "Pacific/Honolulu"  # Hawaii
-    else:
-        # Create a basic mapping of common coordinates to timezones
-        # This is just an approximation
-        if 55.75 <= lat <= 56.75 and 37.0 <= lng <= 38.0:  # Moscow
-            return "Europe/Moscow"
-        elif 40.7 <= lat <= 41.7 and -74.0 <= lng <= -73.0:  # New York
-            return "America/New_York"
-        elif 35.6 <= lat <= 36.6 and 139.0 <= lng <= 140.0:  # Tokyo
-            return "Asia/Tokyo"
-        elif 51.0 <= lat <= 52.0 and -0.5 <= lng <= 0.5:  # London
-            return "Europe/London"
-        elif 34.0 <= lat <= 35.0 and -118.0 <= lng <= -117.0:  # Los Angeles
-            return "America/Los_Angeles"
-        else:
-            # Default to Moscow if in Russia, or UTC otherwise
-            if (
-                41.0 <= lat <= 82.0 and 19.0 <= lng <= 169.0
-            ):  # Approximate Russia coordinates
-                return "Europe/Moscow"
-            else:
-                return "UTC"
-
-
 # ==================== TIMEZONE SELECTION HANDLERS ====================
 
 
@@ -560,19 +520,20 @@ async def cb_select_specific_timezone(callback: CallbackQuery):
 async def cb_get_cat(callback: CallbackQuery, cat_api_key: str, db_path: str):
     user_id = callback.from_user.id
 
-    # Register user if first interaction
-    if not await is_bot_user(user_id):
-        await add_bot_user(user_id)
-
     await callback.answer("Ищу котика...", show_alert=False)
-    image_url = await get_cat_image_url(cat_api_key)
+    image_url = await get_random_cat_url(cat_api_key, exclude=await get_history(user_id))
 
     if image_url:
         try:
-            # Send cat photo
-            await safe_message_answer_photo(
-                callback, photo=image_url, caption="Вот ваш случайный котик! ❤️"
+            # Send cat photo (by file_id if Telegram already has it)
+            sent = await safe_message_answer_photo(
+                callback,
+                photo=as_input_photo(image_url),
+                caption="Вот ваш случайный котик! ❤️",
             )
+            remember_from_message(image_url, sent)
+            if sent is not None:
+                await record_image(user_id, image_url)
 
             # Send menu with buttons again
             is_subscribed = await is_user_subscribed(user_id)
@@ -1,8 +1,12 @@
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+# Клавиатуры не зависят от пользователя, поэтому каждая собирается один раз
+# при импорте, а функции get_* возвращают общие готовые экземпляры.
+# Изменять возвращаемую разметку нельзя: она разделяется между всеми вызовами.
 
-def get_main_keyboard(is_subscribed: bool) -> InlineKeyboardMarkup:
+
+def _build_main_keyboard(is_subscribed: bool) -> InlineKeyboardMarkup:
     """Генерирует основную клавиатуру в зависимости от статуса подписки."""
     builder = InlineKeyboardBuilder()
 
@@ -23,14 +27,17 @@ def get_main_keyboard(is_subscribed: bool) -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_time_selection_keyboard() -> InlineKeyboardMarkup:
-    """Генерирует клавиатуру для выбора времени получения кота."""
+MINUTE_STEP = 5
+
+
+def _build_time_selection_keyboard() -> InlineKeyboardMarkup:
+    """Генерирует клавиатуру для выбора часа получения кота."""
     builder = InlineKeyboardBuilder()
 
-    # Create buttons for each hour of the day (00:00 to 23:00)
+    # Create buttons for each hour of the day; the minute is chosen on the next step
     for hour in range(24):
-        time_text = f"{hour:02d}:00"
-        callback_data = f"set_time_{hour:02d}"
+        time_text = f"{hour:02d}:__"
+        callback_data = f"pick_hour_{hour:02d}"
         builder.button(text=time_text, callback_data=callback_data)
 
     # Add a back button
@@ -40,7 +47,23 @@ def get_time_selection_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_timezone_change_keyboard() -> InlineKeyboardMarkup:
+def _build_minute_selection_keyboard(hour: int) -> InlineKeyboardMarkup:
+    """Генерирует клавиатуру для выбора минуты внутри выбранного часа."""
+    builder = InlineKeyboardBuilder()
+
+    for minute in range(0, 60, MINUTE_STEP):
+        time_text = f"{hour:02d}:{minute:02d}"
+        callback_data = f"set_time_{hour:02d}_{minute:02d}"
+        builder.button(text=time_text, callback_data=callback_data)
+
+    # Back to the hour selection
+    builder.button(text="◀️ Назад", callback_data="change_time")
+
+    builder.adjust(4)  # 4 buttons per row
+    return builder.as_markup()
+
+
+def _build_timezone_change_keyboard() -> InlineKeyboardMarkup:
     """Генерирует клавиатуру для изменения таймзоны."""
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -52,7 +75,7 @@ def get_timezone_change_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_main_keyboard_with_timezone(is_subscribed: bool) -> InlineKeyboardMarkup:
+def _build_main_keyboard_with_timezone(is_subscribed: bool) -> InlineKeyboardMarkup:
     """Генерирует основную клавиатуру с опцией изменения таймзоны."""
     builder = InlineKeyboardBuilder()
 
@@ -73,7 +96,7 @@ def get_main_keyboard_with_timezone(is_subscribed: bool) -> InlineKeyboardMarkup
     return builder.as_markup()
 
 
-def get_timezone_selection_keyboard() -> InlineKeyboardMarkup:
+def _build_timezone_selection_keyboard() -> InlineKeyboardMarkup:
     """Генерирует клавиатуру для выбора таймзоны по UTC сдвигу."""
     builder = InlineKeyboardBuilder()
 
@@ -114,7 +137,7 @@ def get_timezone_selection_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_settings_keyboard(is_subscribed: bool = False) -> InlineKeyboardMarkup:
+def _build_settings_keyboard(is_subscribed: bool = False) -> InlineKeyboardMarkup:
     """Генерирует клавиатуру для настроек."""
     builder = InlineKeyboardBuilder()
 
@@ -126,3 +149,49 @@ def get_settings_keyboard(is_subscribed: bool = False) -> InlineKeyboardMarkup:
     builder.button(text="◀️ Назад", callback_data="back_to_main")
     builder.adjust(1)  # Arrange buttons in a single column
     return builder.as_markup()
+
+
+_MAIN_KEYBOARDS = {flag: _build_main_keyboard(flag) for flag in (False, True)}
+_MAIN_KEYBOARDS_WITH_TIMEZONE = {
+    flag: _build_main_keyboard_with_timezone(flag) for flag in (False, True)
+}
+_SETTINGS_KEYBOARDS = {flag: _build_settings_keyboard(flag) for flag in (False, True)}
+_TIME_SELECTION_KEYBOARD = _build_time_selection_keyboard()
+_MINUTE_SELECTION_KEYBOARDS = {hour: _build_minute_selection_keyboard(hour) for hour in range(24)}
+_TIMEZONE_CHANGE_KEYBOARD = _build_timezone_change_keyboard()
+_TIMEZONE_SELECTION_KEYBOARD = _build_timezone_selection_keyboard()
+
+
+def get_main_keyboard(is_subscribed: bool) -> InlineKeyboardMarkup:
+    """Возвращает основную клавиатуру в зависимости от статуса подписки."""
+    return _MAIN_KEYBOARDS[bool(is_subscribed)]
+
+
+def get_main_keyboard_with_timezone(is_subscribed: bool) -> InlineKeyboardMarkup:
+    """Возвращает основную клавиатуру с опцией изменения таймзоны."""
+    return _MAIN_KEYBOARDS_WITH_TIMEZONE[bool(is_subscribed)]
+
+
+def get_settings_keyboard(is_subscribed: bool = False) -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру для настроек."""
+    return _SETTINGS_KEYBOARDS[bool(is_subscribed)]
+
+
+def get_time_selection_keyboard() -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру для выбора времени получения кота."""
+    return _TIME_SELECTION_KEYBOARD
+
+
+def get_minute_selection_keyboard(hour: int) -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру для выбора минуты получения кота в указанном часе."""
+    return _MINUTE_SELECTION_KEYBOARDS[hour]
+
+
+def get_timezone_change_keyboard() -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру для изменения таймзоны."""
+    return _TIMEZONE_CHANGE_KEYBOARD
+
+
+def get_timezone_selection_keyboard() -> InlineKeyboardMarkup:
+    """Возвращает клавиатуру для выбора таймзоны по UTC сдвигу."""
+    return _TIMEZONE_SELECTION_KEYBOARD
@@ -1,5 +1,6 @@
-import pytz
-from datetime import datetime, timezone, time
+from datetime import datetime, timezone
+
+from utils.timezones import get_tz, local_hour_to_utc, utc_hour_to_local
 
 def get_current_utc_time():
     """Get current time in UTC."""
@@ -7,36 +8,23 @@ def get_current_utc_time():
 
 def convert_local_time_to_utc_hour(local_hour, local_tz_name='Europe/Moscow'):
     """Convert a local hour to the corresponding UTC hour for scheduling."""
-    local_tz = pytz.timezone(local_tz_name)
-    # Create a datetime object with the local hour today
-    now = datetime.now()
-    local_time = datetime.combine(now.date(), time(local_hour))
-    # Localize to user's timezone
-    local_time = local_tz.localize(local_time)
-    # Convert to UTC
-    utc_time = local_time.astimezone(timezone.utc)
-    return utc_time.hour
+    # Looked up in the zone's precomputed hour table for today
+    return local_hour_to_utc(local_hour, local_tz_name)
 
 def convert_utc_to_local_hour(utc_hour, local_tz_name='Europe/Moscow'):
     """Convert a UTC hour to the corresponding local hour."""
-    local_tz = pytz.timezone(local_tz_name)
-    # Create a datetime object with the UTC hour today
-    now = datetime.now()
-    utc_time = datetime.combine(now.date(), time(utc_hour, 0, 0, tzinfo=timezone.utc))
-    # Convert to local timezone
-    local_time = utc_time.astimezone(local_tz)
-    return local_time.hour
+    return utc_hour_to_local(utc_hour, local_tz_name)
 
 def convert_utc_to_local(utc_time, local_tz_name='Europe/Moscow'):
     """Convert UTC time to local timezone."""
     if utc_time.tzinfo is None:
         utc_time = utc_time.replace(tzinfo=timezone.utc)
-    local_tz = pytz.timezone(local_tz_name)
+    local_tz = get_tz(local_tz_name)
     return utc_time.astimezone(local_tz)
 
 def convert_local_to_utc(local_time, local_tz_name='Europe/Moscow'):
     """Convert local time to UTC."""
-    local_tz = pytz.timezone(local_tz_name)
+    local_tz = get_tz(local_tz_name)
     if local_time.tzinfo is None:
         local_time = local_tz.localize(local_time)
     return local_time.astimezone(timezone.utc)
@@ -0,0 +1,125 @@
+import bisect
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+
+import pytz
+
+# Offsets never exceed ±14h, so a day in any zone fits in this UTC window
+_MAX_OFFSET = timedelta(hours=14)
+_FOREVER = datetime.max
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+@lru_cache(maxsize=1024)
+def get_tz(name: str):
+    """Returns the cached pytz tzinfo for a zone name."""
+    return pytz.timezone(name)
+
+
+def _next_transition(tz, after: datetime) -> datetime:
+    """First DST/offset transition (naive UTC) after ``after``, or datetime.max."""
+    transitions = getattr(tz, "_utc_transition_times", None)
+    if not transitions:
+        return _FOREVER
+    index = bisect.bisect_right(transitions, after)
+    return transitions[index] if index < len(transitions) else _FOREVER
+
+
+class _HourTable:
+    """Local hour ↔ UTC hour mapping of one zone, valid for days ``day``..``last_day``.
+
+    Outside a DST transition the UTC offset is the same for the whole range,
+    so local times are converted by arithmetic. A table built for a day with a
+    transition covers only that day and converts times with pytz.
+    """
+
+    __slots__ = ("tz", "day", "last_day", "offset", "to_utc", "to_local")
+
+    def __init__(self, tz, day: date):
+        self.tz = tz
+        self.day = day
+        self.to_utc = [
+            tz.localize(datetime.combine(day, time(hour))).astimezone(timezone.utc).hour
+            for hour in range(24)
+        ]
+        self.to_local = [
+            datetime.combine(day, time(hour, tzinfo=timezone.utc)).astimezone(tz).hour
+            for hour in range(24)
+        ]
+        # The table stays correct until an offset change reaches a later day
+        valid_until = _next_transition(tz, datetime.combine(day, time()) - _MAX_OFFSET)
+        if datetime.combine(day + timedelta(days=1), time()) + _MAX_OFFSET < valid_until:
+            self.last_day = (valid_until - _MAX_OFFSET - timedelta(microseconds=1)).date()
+            self.last_day -= timedelta(days=1)
+            offset = tz.localize(datetime.combine(day, time(12))).utcoffset()
+            self.offset = int(offset.total_seconds())
+        else:
+            self.last_day = day
+            self.offset = None
+
+    def covers(self, day: date) -> bool:
+        return self.day <= day <= self.last_day
+
+    def timestamp(self, day: date, hour: int, minute: int) -> int:
+        """Unix time of ``hour:minute`` local time on ``day`` (a day the table covers).
+
+        A local time skipped by a DST jump is moved forward by the size of the gap.
+        """
+        if self.offset is None:
+            local = self.tz.localize(datetime.combine(day, time(hour, minute)))
+            return int(self.tz.normalize(local).timestamp())
+        return (day.toordinal() - _EPOCH_ORDINAL) * 86400 + hour * 3600 + minute * 60 - self.offset
+
+
+@lru_cache(maxsize=4096)
+def _day_table(name: str, day: date) -> _HourTable:
+    return _HourTable(get_tz(name), day)
+
+
+_tables: dict[str, _HourTable] = {}
+
+
+def get_hour_table(name: str, day: date | None = None) -> _HourTable:
+    """Returns the hour table of a zone, rebuilding it only after a DST transition.
+
+    Days next to a transition get a table of their own, cached per (zone, day).
+    """
+    day = day or datetime.now().date()
+    table = _tables.get(name)
+    if table is None or not table.covers(day):
+        table = _day_table(name, day)
+        _tables[name] = table
+    return table
+
+
+def _check_hour(hour: int):
+    if not 0 <= hour < 24:
+        raise ValueError(f"hour must be in 0..23, got {hour}")
+
+
+def local_hour_to_utc(local_hour: int, name: str) -> int:
+    """UTC hour that corresponds to ``local_hour`` today in zone ``name``."""
+    _check_hour(local_hour)
+    return get_hour_table(name).to_utc[local_hour]
+
+
+def utc_hour_to_local(utc_hour: int, name: str) -> int:
+    """Local hour in zone ``name`` that corresponds to ``utc_hour`` today."""
+    _check_hour(utc_hour)
+    return get_hour_table(name).to_local[utc_hour]
+
+
+def next_occurrence(hour: int, minute: int, name: str, after: datetime | None = None) -> int:
+    """Unix time of the next ``hour:minute`` local time in zone ``name`` after ``after``.
+
+    A local time skipped by a DST jump is moved forward by the size of the gap.
+    """
+    after = after or datetime.now(timezone.utc)
+    local_day = after.astimezone(get_tz(name)).date()
+    after_ts = after.timestamp()
+    for days in range(3):
+        day = local_day + timedelta(days=days)
+        candidate = get_hour_table(name, day).timestamp(day, hour, minute)
+        if candidate > after_ts:
+            return candidate
+    raise ValueError(f"no occurrence of {hour:02d}:{minute:02d} in {name} after {after}")